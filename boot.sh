@@ -1,4 +1,5 @@
 #!/bin/sh
 export FLASK_APP=run.py
 flask db upgrade
-exec gunicorn -w 1 -b 127.0.0.1:8000 --access-logfile logs/access.log --error-logfile logs/error.log run:app
\ No newline at end of file
+# workers, threads and hooks are set by gunicorn.conf.py and "GUNICORN_*" env vars
+exec gunicorn -c gunicorn.conf.py run:app
@@ -12,6 +12,10 @@ env = t.MappingProxyType({
     **dotenv_values('.env.shared'),
 })
 
+CPU_COUNT: int = os.cpu_count() or 1
+# gunicorn worker processes (see gunicorn.conf.py), every one of them starts its own password hashing pool
+GUNICORN_WORKERS: int = int(env.get('GUNICORN_WORKERS') or CPU_COUNT + 1)
+
 
 class APIConfig:
     """A class for the Flask application"""
@@ -26,7 +30,11 @@ class APIConfig:
     DEBUG = bool(int(env.get('DEBUG', '1')))
     ENV = env.get('FLASK_ENV', 'development')
     # https://flask.palletsprojects.com/en/2.0.x/config/#configuring-from-data-files "JSON_SORT_KEYS"
-    JSON_SORT_KEYS = bool(env.get('JSON_SORT_KEYS', 1))
+    JSON_SORT_KEYS = bool(int(env.get('JSON_SORT_KEYS', 1)))
+    # "auto" (orjson if it is installed), "orjson" or "json", see src.utils.json_provider.JSONProviders
+    JSON_PROVIDER = env.get('JSON_PROVIDER', 'auto')
+    # error bodies are not sorted by default, their fixed fields are serialized once anyway
+    JSON_SORT_ERRORS_KEYS = bool(int(env.get('JSON_SORT_ERRORS_KEYS', 0)))
 
     # DB
     SQLALCHEMY_DATABASE_URI = env.get('DATABASE_URL', '').format(
@@ -35,12 +43,20 @@ class APIConfig:
         DB_NAME=env.get('DB_NAME', ''),
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = bool(env.get('SQLALCHEMY_TRACK_MODIFICATIONS', 0))
+    # create missing tables on the first request of a process, not needed if "flask db upgrade" is run
+    DB_CREATE_ALL = bool(int(env.get('DB_CREATE_ALL', 1)))
 
     # JWT TOKEN
     JWT_ACCESS_TOKEN_EXPIRATION = int(env.get('JWT_ACCESS_TOKEN_EXPIRATION', 30))
     JWT_REFRESH_TOKEN_EXPIRATION = int(env.get('JWT_REFRESH_TOKEN_EXPIRATION', 30))
     JWT_ALGORITHM = env.get('JWT_ALGORITHM', 'HS256')
     JWT_ISSUER = env.get('JWT_ISSUER')
+    # "minimal" or "full", see utils.token_generators.AccessTokenProfiles
+    JWT_ACCESS_TOKEN_PROFILE = env.get('JWT_ACCESS_TOKEN_PROFILE', 'minimal')
+    # max number of verified tokens cached by utils.JWTDecoder, 0 disables the cache
+    JWT_DECODE_CACHE_SIZE = int(env.get('JWT_DECODE_CACHE_SIZE', 0))
+    # "jwt" or "opaque", see utils.token_generators.RefreshTokenTypes
+    REFRESH_TOKEN_TYPE = env.get('REFRESH_TOKEN_TYPE', 'jwt')
 
     # REDIS
     REDIS_HOST = env.get('REDIS_HOST', '127.0.0.1')
@@ -48,9 +64,94 @@ class APIConfig:
     REDIS_PWD = env.get('REDIS_PWD', '')
     REDIS_JWT_DB = int(env.get('REDIS_JWT_DB', 0))
     REDIS_RESET_EMAIL_TOKENS_DB = int(env.get('REDIS_RESET_EMAIL_TOKENS_DB', 1))
+    # "redis" or "memory", see utils.storage_controllers.TokenStorageBackends
+    TOKEN_STORAGE_BACKEND = env.get('TOKEN_STORAGE_BACKEND', 'redis')
+    # "plain" or "digest", see utils.storage_controllers.TokenStorageModes
+    REFRESH_TOKEN_STORAGE_MODE = env.get('REFRESH_TOKEN_STORAGE_MODE', 'plain')
+    REDIS_POOL_MAX_CONNECTIONS = int(env.get('REDIS_POOL_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(env.get('REDIS_SOCKET_TIMEOUT', 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(env.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+    REDIS_HEALTH_CHECK_INTERVAL = int(env.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+    # USER PRINCIPAL CACHE
+    USER_PRINCIPAL_CACHE_TTL = int(env.get('USER_PRINCIPAL_CACHE_TTL', 0))
+    USER_PRINCIPAL_CACHE_LOCAL_TTL = int(env.get('USER_PRINCIPAL_CACHE_LOCAL_TTL', 5))
+    USER_PRINCIPAL_CACHE_SIZE = int(env.get('USER_PRINCIPAL_CACHE_SIZE', 10000))
+    # also checks "full" profile access tokens against password changes of other workers (after up to
+    # "USER_PRINCIPAL_CACHE_LOCAL_TTL" seconds), without it other workers accept such tokens until they expire
+    USER_PRINCIPAL_CACHE_REDIS = bool(int(env.get('USER_PRINCIPAL_CACHE_REDIS', 0)))
+
+    # PASSWORD HASHING
+    # processes of utils.PasswordHasher pool of every gunicorn worker, 0 hashes passwords in a request worker,
+    # by default the pools of all workers have about one process per CPU
+    PASSWORD_HASHING_WORKERS = int(env.get('PASSWORD_HASHING_WORKERS') or max(1, CPU_COUNT // GUNICORN_WORKERS))
+    PASSWORD_HASHING_MAX_PENDING = int(env.get('PASSWORD_HASHING_MAX_PENDING', 4 * CPU_COUNT))
+    PASSWORD_HASHING_QUEUE_SIZE = int(env.get('PASSWORD_HASHING_QUEUE_SIZE', 16))
+    PASSWORD_HASHING_QUEUE_TIMEOUT = float(env.get('PASSWORD_HASHING_QUEUE_TIMEOUT', 2))
+    PASSWORD_HASHING_RETRY_AFTER = int(env.get('PASSWORD_HASHING_RETRY_AFTER', 1))
+    # max running hashing operations of all workers (shared via Redis), 0 disables the limit
+    PASSWORD_HASHING_GLOBAL_LIMIT = int(env.get('PASSWORD_HASHING_GLOBAL_LIMIT', 0))
+    # "pbkdf2", "scrypt" or "argon2", see utils.password_hashers.PasswordHashMethods
+    # "flask passwords calibrate" suggests cost parameters for a target latency
+    PASSWORD_HASH_METHOD = env.get('PASSWORD_HASH_METHOD', 'pbkdf2')
+    PASSWORD_PBKDF2_ITERATIONS = int(env.get('PASSWORD_PBKDF2_ITERATIONS', 260000))
+    PASSWORD_SCRYPT_N = int(env.get('PASSWORD_SCRYPT_N', 32768))
+    PASSWORD_SCRYPT_R = int(env.get('PASSWORD_SCRYPT_R', 8))
+    PASSWORD_SCRYPT_P = int(env.get('PASSWORD_SCRYPT_P', 1))
+    PASSWORD_ARGON2_TIME_COST = int(env.get('PASSWORD_ARGON2_TIME_COST', 3))
+    PASSWORD_ARGON2_MEMORY_COST = int(env.get('PASSWORD_ARGON2_MEMORY_COST', 65536))
+    PASSWORD_ARGON2_PARALLELISM = int(env.get('PASSWORD_ARGON2_PARALLELISM', 4))
+
+    # RATE LIMITS
+    # "redis" or "memory", see utils.rate_limiters.RateLimiterBackends
+    RATE_LIMITER_BACKEND = env.get('RATE_LIMITER_BACKEND', 'redis')
+    # number of trusted reverse proxies in front of the app, a client IP is taken from their "X-Forwarded-For"
+    # values, 0 uses the address of the connected peer
+    PROXY_FIX_X_FOR = int(env.get('PROXY_FIX_X_FOR', 0))
+    # "<hits>/<seconds>" sliding windows, an empty value disables a limit,
+    # "LOGIN_USERNAME" counts failed logins of a username from one client IP only
+    RATE_LIMIT_LOGIN_IP = env.get('RATE_LIMIT_LOGIN_IP', '30/60')
+    RATE_LIMIT_LOGIN_USERNAME = env.get('RATE_LIMIT_LOGIN_USERNAME', '10/300')
+    RATE_LIMIT_REGISTER_IP = env.get('RATE_LIMIT_REGISTER_IP', '10/3600')
+    RATE_LIMIT_FORGOT_PASSWORD_IP = env.get('RATE_LIMIT_FORGOT_PASSWORD_IP', '10/600')
+    RATE_LIMIT_FORGOT_PASSWORD_EMAIL = env.get('RATE_LIMIT_FORGOT_PASSWORD_EMAIL', '3/600')
+
+    # METRICS
+    METRICS_ENABLED = bool(int(env.get('METRICS_ENABLED', 0)))
+    # a bearer token required by the "/metrics" endpoint, an empty value leaves it open
+    METRICS_TOKEN = env.get('METRICS_TOKEN', '')
+    # a directory shared by all gunicorn workers, every worker dumps its metrics there,
+    # an empty value exposes metrics of a single process only
+    METRICS_DIR = env.get('METRICS_DIR', '')
+    METRICS_FLUSH_INTERVAL = float(env.get('METRICS_FLUSH_INTERVAL', 5))
+    # logs request timings, a "Server-Timing" header is added only to requests that send "SERVER_TIMING_TOKEN"
+    # in the "SERVER_TIMING_HEADER" header, an empty token adds it to no request
+    SERVER_TIMING_ENABLED = bool(int(env.get('SERVER_TIMING_ENABLED', 0)))
+    SERVER_TIMING_HEADER = env.get('SERVER_TIMING_HEADER', 'X-Server-Timing-Token')
+    SERVER_TIMING_TOKEN = env.get('SERVER_TIMING_TOKEN', '')
+    # slow command log thresholds, 0 disables the log
+    SLOW_SQL_QUERY_MS = float(env.get('SLOW_SQL_QUERY_MS', 100))
+    SLOW_REDIS_COMMAND_MS = float(env.get('SLOW_REDIS_COMMAND_MS', 20))
+    # max SQL statements and Redis round trips of one request before it is logged as a possible N+1 pattern
+    REQUEST_SQL_QUERIES_WARNING = int(env.get('REQUEST_SQL_QUERIES_WARNING', 10))
+    REQUEST_REDIS_COMMANDS_WARNING = int(env.get('REQUEST_REDIS_COMMANDS_WARNING', 10))
+    METRICS_LATENCY_BUCKETS = env.get('METRICS_LATENCY_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10')
+
+    # PROFILER
+    # a fraction of profiled requests, see utils.profiler.SamplingProfiler
+    PROFILER_SAMPLE_RATE = float(env.get('PROFILER_SAMPLE_RATE', 0))
+    # requests with the header equal to the token are always profiled, an empty token disables the header
+    PROFILER_HEADER = env.get('PROFILER_HEADER', 'X-Profile-Token')
+    PROFILER_TOKEN = env.get('PROFILER_TOKEN', '')
+    PROFILER_INTERVAL_MS = float(env.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_FLUSH_INTERVAL = float(env.get('PROFILER_FLUSH_INTERVAL', 30))
+    PROFILER_DIR = env.get('PROFILER_DIR', 'logs/profiles')
 
     # EMAIL
     MAIL_EXPIRES_IN = int(env.get('MAIL_EXPIRES_IN', 120))
+    # repeated forgot password requests of an email address within the window get the first outcome,
+    # see utils.ResetPasswordEmailStorageController, 0 disables it
+    RESET_PASSWORD_EMAIL_WINDOW = int(env.get('RESET_PASSWORD_EMAIL_WINDOW', 60))
     MAIL_SERVER = env.get('MAIL_SERVER', 'localhost')
     MAIL_PORT = env.get('MAIL_PORT', 25)
     MAIL_USE_TLS = bool(env.get('MAIL_USE_TLS', False))
@@ -58,7 +159,13 @@ class APIConfig:
     MAIL_USERNAME = env.get('MAIL_USERNAME', None)
     MAIL_PASSWORD = env.get('MAIL_PASSWORD', None)
     MAIL_DEFAULT_SENDER = env.get('MAIL_DEFAULT_SENDER', 'noreply@authapi.com')
-    MAIL_MAX_EMAILS = env.get('MAIL_MAX_EMAILS', 1)
+    # max emails sent over one SMTP connection, a batch size of utils.EmailSender workers
+    MAIL_MAX_EMAILS = int(env.get('MAIL_MAX_EMAILS', 50))
+    # threads of the utils.EmailSender queue, 0 sends emails in a request worker
+    EMAIL_WORKERS = int(env.get('EMAIL_WORKERS', 2))
+    EMAIL_QUEUE_SIZE = int(env.get('EMAIL_QUEUE_SIZE', 1000))
+    EMAIL_MAX_RETRIES = int(env.get('EMAIL_MAX_RETRIES', 3))
+    EMAIL_RETRY_BACKOFF = float(env.get('EMAIL_RETRY_BACKOFF', 2))
 
     # GOOGLE AUTH
     GOOGLE_CLIENT_ID = env.get('GOOGLE_CLIENT_ID', 'no-id')
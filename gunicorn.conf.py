@@ -0,0 +1,135 @@
+"""Production gunicorn settings, gunicorn loads this module from the working directory by default.
+
+Notes:
+    The app is imported once by the master ("preload_app"), workers are forked from it, so they boot
+    without importing the code again. Utils of run.py are created lazily, but anything the master created
+    before a fork is reset in a worker: Redis pools and the SQLAlchemy pool are recreated, so a worker
+    never shares a socket with the master or another worker. A worker opens DB and Redis connections
+    before it accepts requests and is replaced after "GUNICORN_MAX_REQUESTS" requests.
+"""
+import typing as t
+
+from config import GUNICORN_WORKERS, env
+
+bind = env.get('GUNICORN_BIND', '127.0.0.1:8000')
+# requests wait for MySQL, Redis and SMTP most of the time, so every worker serves several of them in threads,
+# CPU bound password hashing runs in a separate process pool of every worker (see "PASSWORD_HASHING_WORKERS")
+workers = GUNICORN_WORKERS
+threads = int(env.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = bool(int(env.get('GUNICORN_PRELOAD', 1)))
+
+# a worker is replaced after this number of requests (plus a random jitter, so workers are not replaced at once)
+max_requests = int(env.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(env.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+timeout = int(env.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(env.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(env.get('GUNICORN_KEEPALIVE', 5))
+
+# connections of every pool that are opened before a worker accepts requests, 0 disables it
+warm_up_connections = int(env.get('GUNICORN_WARM_UP_CONNECTIONS', threads))
+
+accesslog = env.get('GUNICORN_ACCESS_LOG', 'logs/access.log')
+errorlog = env.get('GUNICORN_ERROR_LOG', 'logs/error.log')
+
+
+def on_starting(server: t.Any) -> None:
+    """Removes metrics dumps of workers of a previous server run
+
+    Args:
+        server (Arbiter): gunicorn master
+
+    Returns:
+        None
+    """
+    import run
+
+    run.metrics.remove_dumps()
+
+
+def pre_fork(server: t.Any, worker: t.Any) -> None:
+    """Closes DB connections of the master, so a worker does not inherit them
+
+    Args:
+        server (Arbiter): gunicorn master
+        worker (Worker): a worker that is going to be forked
+
+    Returns:
+        None
+    """
+    import run
+    from src.models import db
+
+    with run.app.app_context():
+        db.engine.dispose()
+
+
+def post_fork(server: t.Any, worker: t.Any) -> None:
+    """Resets connection pools that a worker inherited from the master
+
+    Args:
+        server (Arbiter): gunicorn master
+        worker (Worker): a forked worker
+
+    Returns:
+        None
+    """
+    import run
+    from src.models import db
+
+    with run.app.app_context():
+        # a new pool without closing inherited connections, they belong to the master
+        db.engine.pool = db.engine.pool.recreate()
+    for name, util in run.get_created_utils().items():
+        if hasattr(util, 'reset_connection_pool'):
+            server.log.debug('Resetting a connection pool of %s...', name)
+            util.reset_connection_pool()
+
+
+def child_exit(server: t.Any, worker: t.Any) -> None:
+    """Adds metrics of an exited worker to the retired metrics dump
+
+    Args:
+        server (Arbiter): gunicorn master
+        worker (Worker): an exited worker
+
+    Returns:
+        None
+    """
+    import run
+
+    run.metrics.retire_dump(worker.pid)
+
+
+def post_worker_init(worker: t.Any) -> None:
+    """Opens DB and Redis connections before a worker accepts requests
+
+    Args:
+        worker (Worker): an initialized worker
+
+    Returns:
+        None
+    """
+    if not warm_up_connections:
+        return
+
+    import run
+    from sqlalchemy import text
+
+    from src.models import db
+
+    try:
+        with run.app.app_context():
+            db.session.execute(text('SELECT 1'))
+            db.session.remove()
+    except Exception as e:
+        worker.log.warning('Failed to warm up DB connections. Error: %s', e)
+
+    for name in ('refresh_token_storage_controller', 'user_principal_cache'):
+        util = getattr(run, name)
+        if not hasattr(util, 'warm_up_connection_pool'):
+            continue
+        try:
+            util.warm_up_connection_pool(warm_up_connections)
+        except Exception as e:
+            worker.log.warning('Failed to warm up Redis connections of %s. Error: %s', name, e)
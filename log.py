@@ -1,23 +1,254 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import sys
+import threading
 import typing as t
+from enum import Enum, unique
 
 from flask_log_request_id import RequestIDLogFilter
 
+from config import env
+
+
+@unique
+class LogFormats(Enum):
+    TEXT = 'text'
+    # one JSON object per line
+    JSON = 'json'
+
+
+def _parse_sample_rates(value: str) -> t.Dict[str, float]:
+    # "src.utils.token_decoders=0.01,src.views=0.1" -> {'src.utils.token_decoders': 0.01, 'src.views': 0.1}
+    rates = {}
+    for item in filter(None, (item.strip() for item in value.split(','))):
+        name, rate = item.split('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
 logger_configs = {
     'level': logging.INFO,
     'filename': 'logs/test.log',
+    # max records waiting for the listener
+    'queue_size': int(env.get('LOG_QUEUE_SIZE', 10000)),
+    # max records written at once
+    'batch_size': int(env.get('LOG_BATCH_SIZE', 256)),
+    # seconds a WARNING or higher record waits for a free slot of a full queue before it is dropped
+    'queue_block_timeout': float(env.get('LOG_QUEUE_BLOCK_TIMEOUT', 0.05)),
+    # "text" or "json", see LogFormats
+    'format': env.get('LOG_FORMAT', LogFormats.TEXT.value),
+    # logger name (or its parent name) -> a fraction of DEBUG and INFO records that are kept
+    'sample_rates': _parse_sample_rates(env.get('LOG_SAMPLE_RATES', '')),
 }
 
 
+class _JSONFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'requestId': getattr(record, 'request_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class _QueueListener(threading.Thread):
+    _STOP = object()
+
+    def __init__(self, records: queue.Queue, handlers: t.List[logging.StreamHandler], batch_size: int) -> None:
+        """Formats and writes queued records in batches, one write and flush per handler and batch
+
+        Args:
+            records (queue.Queue): Queued records
+            handlers (list[logging.StreamHandler]): Output handlers
+            batch_size (int): Max records written at once
+        """
+        super().__init__(name='APILoggerListener', daemon=True)
+        self._records: queue.Queue = records
+        self._handlers: t.List[logging.StreamHandler] = handlers
+        self._batch_size: int = batch_size
+
+    def run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = []
+            record = self._records.get()
+            while True:
+                if record is self._STOP:
+                    stopped = True
+                    break
+                batch.append(record)
+                if len(batch) >= self._batch_size:
+                    break
+                try:
+                    record = self._records.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Writes all queued records and stops the listener
+
+        Args:
+            timeout (float): Max seconds to wait for the listener
+
+        Returns:
+            None
+        """
+        self._records.put(self._STOP)
+        self.join(timeout)
+
+    def _write(self, batch: t.List[logging.LogRecord]) -> None:
+        dropped = _QueueHandler.pop_dropped_count()
+        if dropped:
+            batch.append(logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': logging.getLevelName(logging.WARNING),
+                'msg': f'{dropped} log records were dropped, the log queue is full.',
+                'request_id': '-',
+            }))
+
+        for handler in self._handlers:
+            lines = []
+            for record in batch:
+                if record.levelno < handler.level:
+                    continue
+                try:
+                    lines.append(handler.format(record))
+                except Exception:
+                    handler.handleError(record)
+            if not lines:
+                continue
+            handler.acquire()
+            try:
+                handler.stream.write(handler.terminator.join(lines) + handler.terminator)
+                handler.flush()
+            except Exception:
+                handler.handleError(batch[0])
+            finally:
+                handler.release()
+
+
+class _QueueHandler(logging.Handler):
+    _dropped_count: int = 0
+    _dropped_count_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, msg_format: str) -> None:
+        """A handler that only enqueues records for a background _QueueListener.
+
+        Notes:
+            The queue is bounded by "queue_size" of the logger configs. If it is full,
+            DEBUG and INFO records are dropped at once, WARNING and higher records wait
+            for "queue_block_timeout" seconds and are dropped after it. The listener reports
+            the number of dropped records.
+            The request ID filter runs here, in the thread that logs a record.
+            The listener thread does not survive a fork, so it is restarted in a new process.
+
+        Args:
+            msg_format (str): Record format
+        """
+        super().__init__()
+        self._msg_format: str = msg_format
+        self._records: t.Optional[queue.Queue] = None
+        self._listener: t.Optional[_QueueListener] = None
+        self._listener_pid: t.Optional[int] = None
+        self._listener_lock: threading.Lock = threading.Lock()
+        self.addFilter(RequestIDLogFilter())
+        atexit.register(self.stop_listener)
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @classmethod
+    def pop_dropped_count(cls) -> int:
+        """Gets and resets the number of dropped records
+
+        Returns:
+            int: Number of dropped records
+        """
+        with cls._dropped_count_lock:
+            dropped, cls._dropped_count = cls._dropped_count, 0
+        return dropped
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        try:
+            if record.levelno >= logging.WARNING:
+                self._records.put(record, timeout=APILogger.get_config('queue_block_timeout'))
+            else:
+                self._records.put_nowait(record)
+        except queue.Full:
+            with self._dropped_count_lock:
+                _QueueHandler._dropped_count += 1
+
+    def stop_listener(self) -> None:
+        """Writes all queued records and stops the listener of the current process
+
+        Returns:
+            None
+        """
+        with self._listener_lock:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+
+    def _reset_after_fork(self) -> None:
+        # locks may be held by threads of a parent process that do not exist in a child
+        self._listener_lock = threading.Lock()
+        _QueueHandler._dropped_count_lock = threading.Lock()
+        _QueueHandler._dropped_count = 0
+
+    def _start_listener(self) -> None:
+        with self._listener_lock:
+            pid = os.getpid()
+            if self._listener_pid == pid:
+                return
+            if LogFormats(APILogger.get_config('format', LogFormats.TEXT.value)) is LogFormats.JSON:
+                formatter = _JSONFormatter()
+            else:
+                formatter = logging.Formatter(self._msg_format)
+            stream_handler = logging.StreamHandler(sys.stderr)
+            file_handler = logging.FileHandler(APILogger.get_config('filename', 'example.log'))
+            for handler in (stream_handler, file_handler):
+                handler.setFormatter(formatter)
+
+            # a queue of a parent process may hold records that its listener already wrote
+            self._records = queue.Queue(APILogger.get_config('queue_size', 10000))
+            self._listener = _QueueListener(
+                self._records,
+                [stream_handler, file_handler],
+                APILogger.get_config('batch_size', 256),
+            )
+            self._listener.start()
+            self._listener_pid = pid
+
+
 class APILogger(logging.Logger):
     _MSG_FORMAT: str = '%(levelname)s: [%(asctime)s] %(name)s :requestId: %(request_id)s :MSG: %(message)s'
     _logger_configs: t.Dict[str, t.Any] = {}
+    _queue_handler: t.Optional[_QueueHandler] = None
 
     def __init__(self, name: str) -> None:
-        """A logger wrapper class that already have a stream_handler and a file handler configured
+        """A logger wrapper class that writes records to a stream and a file in a background thread
 
         Notes:
-            This logger supports a reqeust ID logging
+            This logger supports a reqeust ID logging.
+            All loggers share one queue handler, a caller thread only enqueues a record,
+            see _QueueHandler for the queue limits and the drop policy.
+            DEBUG and INFO records of a logger may be sampled by "sample_rates" of the logger configs,
+            a sampled out record is not created at all, so messages should use %-style arguments.
 
         Args:
             name (str): Logger name
@@ -25,20 +256,18 @@ class APILogger(logging.Logger):
 
         super().__init__(name)
 
-        # stream_handler
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(logging.Formatter(self._MSG_FORMAT))
-        stream_handler.addFilter(RequestIDLogFilter())  # << Add request id contextual filter
-        self.addHandler(stream_handler)
-
-        # file handler
-        file_handler = logging.FileHandler(self._logger_configs.get('filename', 'example.log'))
-        file_handler.setFormatter(logging.Formatter(self._MSG_FORMAT))
-        file_handler.addFilter(RequestIDLogFilter())
-        self.addHandler(file_handler)
+        if APILogger._queue_handler is None:
+            APILogger._queue_handler = _QueueHandler(self._MSG_FORMAT)
+        self.addHandler(APILogger._queue_handler)
 
         # set level
         self.setLevel(self._logger_configs.get('level', logging.INFO))
+        self._sample_rate: float = self._get_sample_rate(name)
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not super().isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self._sample_rate >= 1.0 or random.random() < self._sample_rate
 
     @classmethod
     def configure_logging(cls, configs: t.Dict[str, t.Any]) -> None:
@@ -53,5 +282,27 @@ class APILogger(logging.Logger):
 
         cls._logger_configs = configs
 
+    @classmethod
+    def get_config(cls, name: str, default: t.Any = None) -> t.Any:
+        """Gets a logger config value
+
+        Args:
+            name (str): Config name
+            default (any): Default value
+
+        Returns:
+            any: Config value
+        """
+        return cls._logger_configs.get(name, default)
+
+    @classmethod
+    def _get_sample_rate(cls, name: str) -> float:
+        sample_rates = cls._logger_configs.get('sample_rates', {})
+        while name:
+            if name in sample_rates:
+                return sample_rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
 
 APILogger.configure_logging(logger_configs)
@@ -9,39 +9,113 @@ __email__ = "miroshveva98@gmail.com"
 __status__ = "Development"
 """
 
+import os
+import threading
+import typing as t
+
 import src.utils as utils
+from src.abstractions.abc_token_storage import ABCTokenStorage
 from src.app import create_app
 
 # init API app
 auth_api = create_app()
+# get Flask app for actual run
+app = auth_api.flask_app
+# get Migrate
+migrate = auth_api.migrate
+# OAuth
+oauth = auth_api.oauth
+# metrics
+metrics = auth_api.metrics
+
 
-# init utils
+# Utils are created on first use (see __getattr__), so importing this module is cheap and touches
+# no external service, and a process forked by "gunicorn --preload" creates its own connection pools.
 # JWT utils
-access_token_generator = utils.AccessTokenGenerator(auth_api.config)
-refresh_token_generator = utils.RefreshTokenGenerator(auth_api.config)
-jwt_decoder = utils.JWTDecoder(auth_api.config)
-refresh_token_storage_controller = utils.RefreshTokenStorageController(
-    auth_api.config['REDIS_HOST'],
-    auth_api.config['REDIS_PORT'],
-    auth_api.config['REDIS_JWT_DB'],
-    auth_api.config['REDIS_PWD'],
-)
-# reset PWD utils
-reset_password_token_generator = utils.ResetPasswordTokenGenerator(auth_api.config)
-reset_password_token_decoder = utils.ResetPasswordTokenDecoder(auth_api.config)
+def _create_jwt_decoder() -> utils.JWTDecoder:
+    jwt_decoder = utils.JWTDecoder(auth_api.config)
+    metrics.register_gauges('jwt_decoder_cache', jwt_decoder.cache_info)
+    return jwt_decoder
+
+
+def _create_refresh_token_storage_controller() -> ABCTokenStorage:
+    controller = utils.create_refresh_token_storage_controller(auth_api.config)
+    if isinstance(controller, utils.RefreshTokenStorageController):
+        metrics.register_gauges('redis_pool', controller.get_pool_stats)
+    return controller
+
+
 # email utils
-email_sender = utils.EmailSender(auth_api.config, auth_api.flask_app)
+def _create_email_sender() -> utils.EmailSender:
+    email_sender = utils.EmailSender(auth_api.config, app)
+    metrics.register_gauges('email_queue', email_sender.get_stats)
+    return email_sender
 
-# get Migrate
-migrate = auth_api.migrate
 
-# OAuth
-oauth = auth_api.oauth
-google_util_config = utils.create_google_config(
-    auth_api.config['BASE_DIR'],
-    auth_api.config['GOOGLE_CONFIG_FILENAME'],
-)
-google_login_util = utils.GoogleLoginUtil(google_util_config)
+# OAuth utils
+def _create_google_login_util() -> utils.GoogleLoginUtil:
+    google_util_config = utils.create_google_config(
+        auth_api.config['BASE_DIR'],
+        auth_api.config['GOOGLE_CONFIG_FILENAME'],
+    )
+    return utils.GoogleLoginUtil(google_util_config)
 
-# get Flask app for actual run
-app = auth_api.flask_app
+
+_UTIL_FACTORIES: t.Dict[str, t.Callable[[], t.Any]] = {
+    # JWT utils
+    'access_token_generator': lambda: utils.AccessTokenGenerator(auth_api.config),
+    'refresh_token_generator': lambda: utils.create_refresh_token_generator(auth_api.config),
+    'jwt_decoder': _create_jwt_decoder,
+    'refresh_token_storage_controller': _create_refresh_token_storage_controller,
+    # auth utils
+    'password_hasher': lambda: utils.PasswordHasher(auth_api.config),
+    'user_principal_cache': lambda: utils.UserPrincipalCache(auth_api.config),
+    'rate_limiter': lambda: utils.RateLimiter(auth_api.config),
+    # reset PWD utils
+    'reset_password_token_generator': lambda: utils.ResetPasswordTokenGenerator(auth_api.config),
+    'reset_password_token_decoder': lambda: utils.ResetPasswordTokenDecoder(auth_api.config),
+    'reset_password_email_storage_controller': lambda: utils.ResetPasswordEmailStorageController(auth_api.config),
+    # email utils
+    'email_sender': _create_email_sender,
+    # OAuth utils
+    'google_login_util': _create_google_login_util,
+}
+# reentrant, a factory may use another util
+_utils_lock: threading.RLock = threading.RLock()
+
+
+def _reset_utils_lock() -> None:
+    # the lock may be held by a thread of a parent process that does not exist in a child
+    global _utils_lock
+    _utils_lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_reset_utils_lock)
+
+
+def __getattr__(name: str) -> t.Any:
+    """Creates a util on first access, the util is stored as a module attribute after it
+
+    Args:
+        name (str): Util name
+
+    Returns:
+        any: Util
+    """
+    factory = _UTIL_FACTORIES.get(name)
+    if factory is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _utils_lock:
+        # another thread may have created it while this one waited for the lock
+        if name not in globals():
+            globals()[name] = factory()
+    return globals()[name]
+
+
+def get_created_utils() -> t.Dict[str, t.Any]:
+    """Gets utils that were already created by the current process or inherited from a parent one
+
+    Returns:
+        dict: Util name -> util
+    """
+    return {name: globals()[name] for name in _UTIL_FACTORIES if name in globals()}
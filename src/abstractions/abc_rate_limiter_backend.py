@@ -0,0 +1,12 @@
+from abc import ABC, abstractmethod
+
+
+class ABCRateLimiterBackend(ABC):
+
+    @abstractmethod
+    def hit(self, key: str, limit: int, window: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def peek(self, key: str, limit: int, window: int) -> int:
+        raise NotImplementedError
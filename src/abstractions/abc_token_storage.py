@@ -0,0 +1,21 @@
+import typing as t
+from abc import ABC, abstractmethod
+
+
+class ABCTokenStorage(ABC):
+
+    @abstractmethod
+    def get_user_id_by_refresh_token(self, refresh_token: str) -> t.Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_user_refresh_token(self, user_id: str, refresh_token: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset_user_refresh_token(self, current_refresh_token: str, new_refresh_token: str) -> t.Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_refresh_token(self, user_id: str) -> None:
+        raise NotImplementedError
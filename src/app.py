@@ -1,3 +1,4 @@
+import threading
 import typing as t
 from http import HTTPStatus
 
@@ -5,14 +6,19 @@ from authlib.integrations.flask_client import OAuth
 from flask import Flask
 from flask_log_request_id import RequestID
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 import log
 from config import APIConfig
-from src.exceptions import AppIsNotConfigured
+from src.commands import json_cli, passwords_cli, profiles_cli, storage_cli
+from src.exceptions import AppIsNotConfigured, CapacityExceededError
 from src.models import db
 from src.schemas import ma
+from src.utils import json_provider, metrics
+from src.utils.profiler import SamplingProfiler
 from src.views import errors as err
 from src.views.auth import auth_bp
+from src.views.metrics import metrics_bp
 from src.views.social_auth import social_auth_bp
 from src.views.users import users_bp
 
@@ -26,6 +32,9 @@ class App:
     def __init__(self) -> None:
         self._app: Flask = Flask(__name__)
         self._is_configured: bool = False
+        self._is_db_schema_checked: bool = False
+        self._db_schema_lock: threading.Lock = threading.Lock()
+        self._metrics: t.Optional[metrics.Metrics] = None
         self._migrate: Migrate = Migrate(self._app)
         self._oauth: OAuth = OAuth(self._app)
 
@@ -33,7 +42,7 @@ class App:
 
     def configure_app(self, config: t.Type[APIConfig]) -> None:
         """Initiates additional modules such as Marshmallow and SQLAlchemy.
-        Register blueprints and add error handlers.
+        Register blueprints, error handlers and CLI commands.
 
         Args:
             config (APIConfig class): a class with all necessary configurations
@@ -44,11 +53,16 @@ class App:
         logger.info('Configuring application...')
         self._app.config.from_object(config)
 
+        self._init_proxy_fix()
         self._init_db()
         self._init_marshmallow()
+        self._init_json_provider()
+        self._init_metrics()
+        self._init_profiler()
 
         self._register_blueprints()
         self._register_error_handlers()
+        self._register_commands()
 
         self._is_configured = True
 
@@ -88,13 +102,62 @@ class App:
             raise AppIsNotConfigured(msg)
         return self._oauth
 
+    @property
+    def metrics(self) -> metrics.Metrics:
+        """Metrics: request and dependency metrics"""
+        if not self._is_configured:
+            msg = self._APP_NOT_CONFIGURED_MSG.format('metrics')
+            logger.error(msg)
+            raise AppIsNotConfigured(msg)
+        return self._metrics
+
+    def _init_proxy_fix(self) -> None:
+        x_for = self._app.config['PROXY_FIX_X_FOR']
+        if x_for:
+            # "remote_addr" is the client IP instead of the proxy one, rate limits by IP rely on it
+            self._app.wsgi_app = ProxyFix(self._app.wsgi_app, x_for=x_for, x_proto=0)
+
     def _init_db(self) -> None:
         db.init_app(self._app)
-        db.create_all(app=self._app)
+        if self._app.config['DB_CREATE_ALL']:
+            # the app is created on import, so the DB is touched only by the first request
+            self._app.before_request(self._check_db_schema)
+
+    def _check_db_schema(self) -> None:
+        if self._is_db_schema_checked:
+            return
+        with self._db_schema_lock:
+            if self._is_db_schema_checked:
+                return
+            logger.info('Creating missing DB tables...')
+            db.create_all(app=self._app)
+            self._is_db_schema_checked = True
 
     def _init_marshmallow(self) -> None:
         ma.init_app(self._app)
 
+    def _init_json_provider(self) -> None:
+        provider = json_provider.create_json_provider(self._app.config)
+        self._app.extensions[json_provider.EXTENSION_NAME] = provider
+        logger.info('JSON provider: %s', provider.name)
+
+    def _init_metrics(self) -> None:
+        self._metrics = metrics.Metrics(self._app.config)
+        if not self._metrics.is_timing:
+            return
+        self._app.before_request(metrics.start_request_timer)
+        self._app.after_request(metrics.observe_request)
+        metrics.instrument_sql_engine()
+        if self._metrics.enabled:
+            self._app.register_blueprint(metrics_bp)
+
+    def _init_profiler(self) -> None:
+        profiler = SamplingProfiler(self._app.config)
+        if not profiler.enabled:
+            return
+        self._app.before_request(profiler.start_request)
+        self._app.teardown_request(profiler.stop_request)
+
     def _register_blueprints(self) -> None:
         self._app.register_blueprint(auth_bp)
         self._app.register_blueprint(social_auth_bp)
@@ -108,8 +171,16 @@ class App:
         self._app.register_error_handler(HTTPStatus.METHOD_NOT_ALLOWED, err.method_not_allowed)
         self._app.register_error_handler(HTTPStatus.CONFLICT, err.conflict)
         self._app.register_error_handler(HTTPStatus.UNPROCESSABLE_ENTITY, err.unprocessed_entity)
+        self._app.register_error_handler(HTTPStatus.TOO_MANY_REQUESTS, err.too_many_requests)
         # 5xx
         self._app.register_error_handler(HTTPStatus.INTERNAL_SERVER_ERROR, err.internal_server_error)
+        self._app.register_error_handler(CapacityExceededError, err.service_unavailable)
+
+    def _register_commands(self) -> None:
+        self._app.cli.add_command(storage_cli)
+        self._app.cli.add_command(passwords_cli)
+        self._app.cli.add_command(profiles_cli)
+        self._app.cli.add_command(json_cli)
 
 
 def create_app() -> App:
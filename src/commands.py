@@ -0,0 +1,267 @@
+import collections
+import datetime
+import math
+import os
+import statistics
+import time
+import typing as t
+import uuid
+
+import click
+import jwt
+from flask.cli import AppGroup
+from redis import Redis
+
+import log
+import run
+import src.utils as utils
+from src import password_hashing
+from src.utils import json_provider
+from src.utils.profiler import COLLAPSED_STACKS_EXTENSION
+
+logger = log.APILogger(__name__)
+
+storage_cli = AppGroup('storage', help='Refresh token storage maintenance commands.')
+passwords_cli = AppGroup('passwords', help='Password hashing commands.')
+profiles_cli = AppGroup('profiles', help='Request profiler commands.')
+json_cli = AppGroup('json', help='JSON provider commands.')
+
+# a cost parameter scaled by the calibration: (config name, parameter name, baseline value)
+_CALIBRATED_PARAMS: t.Dict[utils.PasswordHashMethods, t.Tuple[str, str, int]] = {
+    utils.PasswordHashMethods.PBKDF2: ('PASSWORD_PBKDF2_ITERATIONS', 'iterations', 10000),
+    utils.PasswordHashMethods.SCRYPT: ('PASSWORD_SCRYPT_N', 'n', 2 ** 12),
+    utils.PasswordHashMethods.ARGON2: ('PASSWORD_ARGON2_TIME_COST', 'time_cost', 1),
+}
+_MAX_SCRYPT_N: int = 2 ** 20
+# response bodies of the benchmarked response classes
+_JSON_BENCHMARK_BODIES: t.Dict[str, t.Any] = {
+    'tokens': {'accessToken': 'a' * 300, 'refreshToken': 'r' * 300},
+    'user': {'id': str(uuid.uuid4()), 'emailAddress': 'user@example.com', 'username': 'user', 'isActive': True},
+    'error': {'status': 'FAILED', 'message': 'Invalid request body was provided.',
+              'details': {'emailAddress': ['Not a valid email address.'], 'password': ['Missing data.']}},
+}
+
+
+def _get_refresh_token_ttl(refresh_token: str) -> t.Optional[int]:
+    try:
+        data = run.jwt_decoder.decode_token(refresh_token)
+    except jwt.InvalidTokenError:
+        return None
+    now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+    return int(data['exp'] - now) if 'exp' in data else None
+
+
+def _get_redis_storage_controller() -> utils.RefreshTokenStorageController:
+    controller = run.refresh_token_storage_controller
+    if not isinstance(controller, utils.RefreshTokenStorageController):
+        raise click.ClickException('The command requires the "redis" token storage backend.')
+    return controller
+
+
+@storage_cli.command('compact')
+def compact() -> None:
+    """Moves live sessions from the legacy "refreshTokens" hash to TTL-bounded keys and drops expired ones"""
+    logger.info('Compacting the legacy refresh token storage...')
+    stats = _get_redis_storage_controller().compact_legacy_storage(_get_refresh_token_ttl)
+    click.echo(f'Migrated sessions: {stats["migrated"]}. Removed sessions: {stats["removed"]}.')
+
+
+@storage_cli.command('migrate-digest')
+def migrate_digest() -> None:
+    """Replaces full refresh tokens in session keys by their digests ("digest" storage mode)"""
+    logger.info('Migrating refresh token sessions to the digest storage mode...')
+    stats = _get_redis_storage_controller().migrate_to_digest_storage()
+    click.echo(f'Migrated sessions: {stats["migrated"]}. Skipped sessions: {stats["skipped"]}.')
+
+
+@storage_cli.command('benchmark-memory')
+@click.option('--db', 'db', type=int, required=True, help='An empty Redis DB to run the benchmark in.')
+@click.option('--sessions', 'sessions', type=int, default=10000, show_default=True, help='Sessions per mode.')
+def benchmark_memory(db: int, sessions: int) -> None:
+    """Measures Redis memory used by one refresh token session in every storage mode"""
+    config = run.auth_api.config
+    if db == config['REDIS_JWT_DB']:
+        raise click.BadParameter('Can not run a benchmark in the refresh token DB.', param_hint='--db')
+
+    for mode in utils.TokenStorageModes:
+        controller = utils.RefreshTokenStorageController(
+            config['REDIS_HOST'],
+            config['REDIS_PORT'],
+            db,
+            config['REDIS_PWD'],
+            token_expiration=config['JWT_REFRESH_TOKEN_EXPIRATION'],
+            storage_mode=mode.value,
+        )
+        redis_conn = Redis(connection_pool=controller.connection_pool)
+        if redis_conn.dbsize():
+            raise click.BadParameter(f'Redis DB {db} is not empty.', param_hint='--db')
+
+        used_memory = redis_conn.info('memory')['used_memory']
+        for _ in range(sessions):
+            controller.set_user_refresh_token(str(uuid.uuid4()), run.refresh_token_generator.create_token())
+        used_memory = redis_conn.info('memory')['used_memory'] - used_memory
+        redis_conn.flushdb()
+        click.echo(f'{mode.value}: {used_memory / sessions:.0f} bytes per session ({sessions} sessions).')
+
+
+@storage_cli.command('benchmark-refresh')
+@click.option('--requests', 'requests_count', type=int, default=1000, show_default=True,
+              help='Refresh requests per token type.')
+@click.option('--backend', 'backend', type=click.Choice([b.value for b in utils.TokenStorageBackends]),
+              help='Token storage backend. The configured one is used by default.')
+def benchmark_refresh(requests_count: int, backend: t.Optional[str]) -> None:
+    """Measures "/auth/refresh" latency for every refresh token type"""
+    config = run.auth_api.config
+    configured_token_type = config['REFRESH_TOKEN_TYPE']
+    configured_generator = run.refresh_token_generator
+    configured_storage_controller = run.refresh_token_storage_controller
+    client = run.app.test_client()
+    try:
+        if backend:
+            run.refresh_token_storage_controller = utils.create_refresh_token_storage_controller(
+                {**config, 'TOKEN_STORAGE_BACKEND': backend}
+            )
+        for token_type in utils.RefreshTokenTypes:
+            config['REFRESH_TOKEN_TYPE'] = token_type.value
+            run.refresh_token_generator = utils.create_refresh_token_generator(config)
+            user_id = str(uuid.uuid4())
+            refresh_token = run.refresh_token_generator.create_token()
+            run.refresh_token_storage_controller.set_user_refresh_token(user_id, refresh_token)
+
+            latencies = []
+            for _ in range(requests_count):
+                started_at = time.perf_counter()
+                response = client.post('/auth/refresh', json={'refreshToken': refresh_token})
+                latencies.append(time.perf_counter() - started_at)
+                refresh_token = response.get_json()['refreshToken']
+            run.refresh_token_storage_controller.remove_refresh_token(user_id)
+
+            latencies.sort()
+            click.echo(
+                f'{token_type.value}: mean {statistics.mean(latencies) * 1000:.3f} ms, '
+                f'p50 {latencies[len(latencies) // 2] * 1000:.3f} ms, '
+                f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms ({requests_count} requests).'
+            )
+    finally:
+        config['REFRESH_TOKEN_TYPE'] = configured_token_type
+        run.refresh_token_generator = configured_generator
+        run.refresh_token_storage_controller = configured_storage_controller
+
+
+def _measure_password_hashing(method: utils.PasswordHashMethods, params: t.Dict[str, int], rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        password_hashing.generate_password_hash('calibration-password', method.value, params)
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings)
+
+
+def _scale_cost_parameter(method: utils.PasswordHashMethods, baseline: int, factor: float) -> int:
+    if method is utils.PasswordHashMethods.SCRYPT:
+        # scrypt N must be a power of 2
+        return min(max(2 ** round(math.log2(baseline * factor)), baseline), _MAX_SCRYPT_N)
+    if method is utils.PasswordHashMethods.PBKDF2:
+        return max(round(baseline * factor, -3), baseline)
+    return max(round(baseline * factor), baseline)
+
+
+@passwords_cli.command('calibrate')
+@click.option('--target-ms', 'target_ms', type=float, default=250, show_default=True,
+              help='Target latency of one password hashing.')
+@click.option('--rounds', 'rounds', type=int, default=5, show_default=True, help='Measurements per setting.')
+def calibrate(target_ms: float, rounds: int) -> None:
+    """Benchmarks every password hash method on this host and suggests cost parameters"""
+    config = run.auth_api.config
+    for method, (config_name, param_name, baseline) in _CALIBRATED_PARAMS.items():
+        if method is utils.PasswordHashMethods.ARGON2 and password_hashing.argon2 is None:
+            click.echo(f'{method.value}: skipped, argon2-cffi is not installed.')
+            continue
+
+        params = utils.PasswordHasher.get_params(config, method)
+        current_ms = _measure_password_hashing(method, params, rounds) * 1000
+
+        params[param_name] = baseline
+        baseline_ms = _measure_password_hashing(method, params, rounds) * 1000
+        params[param_name] = _scale_cost_parameter(method, baseline, target_ms / baseline_ms)
+        suggested_ms = _measure_password_hashing(method, params, rounds) * 1000
+
+        click.echo(
+            f'{method.value}: current {config_name}={config[config_name]} takes {current_ms:.1f} ms, '
+            f'suggested {config_name}={params[param_name]} takes {suggested_ms:.1f} ms.'
+        )
+
+
+@json_cli.command('benchmark')
+@click.option('--rounds', 'rounds', type=int, default=100000, show_default=True, help='Serializations per setting.')
+def benchmark_json(rounds: int) -> None:
+    """Measures serialization cost of response bodies for every JSON provider with and without sorted keys"""
+    config = run.auth_api.config
+    providers = [json_provider.JSONProviders.STDLIB]
+    if json_provider.orjson is not None:
+        providers.append(json_provider.JSONProviders.ORJSON)
+    for provider_name in providers:
+        provider = json_provider.create_json_provider(config, provider_name.value)
+        for body_name, body in _JSON_BENCHMARK_BODIES.items():
+            timings = {}
+            for sort_keys in (False, True):
+                started_at = time.perf_counter()
+                for _ in range(rounds):
+                    provider.dumps(body, sort_keys)
+                timings[sort_keys] = (time.perf_counter() - started_at) / rounds * 1e6
+            click.echo(
+                f'{provider.name} {body_name}: {timings[False]:.2f} us, sorted {timings[True]:.2f} us '
+                f'(+{(timings[True] / timings[False] - 1) * 100:.0f}%).'
+            )
+
+
+def _read_collapsed_stacks(profiles_dir: str) -> t.Dict[str, t.Counter[str]]:
+    # "<endpoint>.<pid>.collapsed" files -> endpoint -> stack -> samples
+    stacks = collections.defaultdict(collections.Counter)
+    for filename in os.listdir(profiles_dir):
+        if not filename.endswith(COLLAPSED_STACKS_EXTENSION):
+            continue
+        endpoint = filename[:-len(COLLAPSED_STACKS_EXTENSION)].rpartition('.')[0]
+        with open(os.path.join(profiles_dir, filename)) as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[endpoint][stack] += int(count)
+    return stacks
+
+
+@profiles_cli.command('summarize')
+@click.option('--dir', 'profiles_dir', type=click.Path(exists=True, file_okay=False),
+              help='Profiles directory. "PROFILER_DIR" is used by default.')
+@click.option('--endpoint', 'endpoint', help='Summarize one endpoint only.')
+@click.option('--top', 'top', type=int, default=10, show_default=True, help='Frames per endpoint.')
+@click.option('--output', 'output_dir', type=click.Path(file_okay=False),
+              help='A directory for merged "<endpoint>.collapsed" files (flamegraph.pl input).')
+def summarize(profiles_dir: t.Optional[str], endpoint: t.Optional[str], top: int, output_dir: t.Optional[str]) -> None:
+    """Merges request profiles of all processes and prints the hottest frames of every endpoint"""
+    profiles_dir = profiles_dir or run.auth_api.config['PROFILER_DIR']
+    if not os.path.isdir(profiles_dir):
+        raise click.ClickException(f'Profiles directory {profiles_dir} does not exist.')
+    stacks_by_endpoint = _read_collapsed_stacks(profiles_dir)
+    if endpoint:
+        stacks_by_endpoint = {endpoint: stacks_by_endpoint.get(endpoint, collections.Counter())}
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    for endpoint_name, stacks in sorted(stacks_by_endpoint.items()):
+        total = sum(stacks.values())
+        click.echo(f'{endpoint_name}: {total} samples')
+        if not total:
+            continue
+        self_samples = collections.Counter()
+        total_samples = collections.Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            self_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+        for frame, count in self_samples.most_common(top):
+            click.echo(f'  self {count / total:6.1%}  total {total_samples[frame] / total:6.1%}  {frame}')
+        if output_dir:
+            with open(os.path.join(output_dir, f'{endpoint_name}{COLLAPSED_STACKS_EXTENSION}'), 'w') as file:
+                file.writelines(f'{stack} {count}\n' for stack, count in stacks.items())
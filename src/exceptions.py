@@ -28,3 +28,9 @@ class ResetPasswordTokenDecodeError(TokenDecodeError):
 
 class DBError(APIError):
     pass
+
+
+class CapacityExceededError(APIError):
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after: int = retry_after
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
+import calendar
 import datetime
 import typing as t
 import uuid
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import exc
-from werkzeug.security import generate_password_hash
 
 import log
 from src.exceptions import DBError
+from src.utils.metrics import timed
+from src.utils.principal_cache import UserPrincipal
 from .mixins import UpdateMixin
 
 logger = log.APILogger(__name__)
@@ -30,6 +32,7 @@ class User(UpdateMixin, db.Model):
     registration_date = db.Column(db.DateTime, name='registrationDate',
                                   default=datetime.datetime.utcnow)
     is_active = db.Column(db.SMALLINT, name='isActive')
+    password_changed_at = db.Column(db.DateTime, name='passwordChangedAt')
 
     @property
     def password(self) -> str:
@@ -38,9 +41,36 @@ class User(UpdateMixin, db.Model):
 
     @password.setter
     def password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        import run
+
+        self.password_hash = run.password_hasher.generate_password_hash(password)
+        self.password_changed_at = datetime.datetime.utcnow()
+
+    def upgrade_password_hash(self, password: str) -> None:
+        """Hashes the current password again with the current hashing method and cost parameters.
+
+        Notes:
+            Unlike the "password" setter it does not change "password_changed_at".
+
+        Args:
+            password (str): The current (already verified) password
+
+        Returns:
+            None
+        """
+        import run
+
+        self.password_hash = run.password_hasher.generate_password_hash(password)
+
+    @property
+    def password_epoch(self) -> int:
+        """int: A UNIX timestamp of the last password change, 0 if it was never changed"""
+        if not self.password_changed_at:
+            return 0
+        return calendar.timegm(self.password_changed_at.utctimetuple())
 
     @classmethod
+    @timed('db', 'get_user_by_email_address')
     def get_by_email_address(cls, email_address: str) -> t.Optional[User]:
         """Gets a user from the DB by an email address
 
@@ -51,10 +81,11 @@ class User(UpdateMixin, db.Model):
              User (optional): User by an email if such exists, None otherwise
         """
 
-        logger.debug(f'Trying to get a user by email address: {email_address}')
+        logger.debug('Trying to get a user by email address: %s', email_address)
         return db.session.query(cls).filter(cls.email_address == email_address).first()
 
     @classmethod
+    @timed('db', 'get_user_by_id')
     def get_by_id(cls, record_id: str) -> t.Optional[User]:
         """Gets a user from the DB by ID
 
@@ -65,10 +96,11 @@ class User(UpdateMixin, db.Model):
             User (optional): User by id if such exists, None otherwise
         """
 
-        logger.debug(f'Trying to get a user by id: {record_id}')
+        logger.debug('Trying to get a user by id: %s', record_id)
         return db.session.query(cls).filter(cls.id == record_id).first()
 
     @classmethod
+    @timed('db', 'get_duplicate_user_id')
     def get_duplicate_id(cls, user_info: t.Dict[str, t.Any]) -> t.Optional[str]:
         """Gets duplicate report ID from the DB if such exists
 
@@ -81,7 +113,7 @@ class User(UpdateMixin, db.Model):
 
         email = user_info['email_address']
         username = user_info['username']
-        logger.debug(f'Checking if user with username: {username} or email address: {email} already exists')
+        logger.debug('Checking if user with username: %s or email address: %s already exists', username, email)
         duplicate = db.session.query(cls) \
             .filter(db.or_(cls.username == email,
                            cls.email_address == username)).first()
@@ -92,6 +124,9 @@ class User(UpdateMixin, db.Model):
     def create_user(cls, user_info: t.Dict[str, t.Any]) -> User:
         """Creates user in the DB.
 
+        Notes:
+            A recent "not found" outcome of a forgot password request for the email address is dropped.
+
         Args:
             user_info (dict): User information.
 
@@ -105,16 +140,19 @@ class User(UpdateMixin, db.Model):
 
         user = cls(**user_info, id=str(uuid.uuid4()), is_active=1)
         user.save_to_db()
+        import run
+
+        run.reset_password_email_storage_controller.release(user.email_address)
         return user
 
     def save_to_db(self) -> None:
-        """Saves a User object in the DB
+        """Saves a User object in the DB and refreshes its cached principal
 
         Returns:
             None
         """
 
-        logger.debug(f'Trying to save user with id: {self.id} into DB...')
+        logger.debug('Trying to save user with id: %s into DB...', self.id)
         try:
             db.session.add(self)
             db.session.commit()
@@ -122,6 +160,9 @@ class User(UpdateMixin, db.Model):
             logger.error(f'Failed to save user with id: {self.id} into DB.\nError type: {type(e)}\nError message: {e}')
             db.session.rollback()
             raise DBError(str(e))
+        import run
+
+        run.user_principal_cache.refresh(UserPrincipal.from_user(self))
 
     def __repr__(self) -> str:
         return f'<{type(self).__name__} {self.username}, {self.email_address}>'
@@ -0,0 +1,130 @@
+# Password hash functions that are run by pool processes of utils.PasswordHasher.
+# The module is kept out of the "src.utils" package, so a spawned pool process
+# imports only this module and not the whole application.
+import hashlib
+import hmac
+import typing as t
+from enum import Enum, unique
+
+from werkzeug import security
+
+import log
+
+try:
+    import argon2
+    from argon2.exceptions import InvalidHash, VerificationError
+except ImportError:  # argon2-cffi is an optional dependency
+    argon2 = None
+
+logger = log.APILogger(__name__)
+
+
+@unique
+class PasswordHashMethods(Enum):
+    PBKDF2 = 'pbkdf2'
+    SCRYPT = 'scrypt'
+    # requires argon2-cffi
+    ARGON2 = 'argon2'
+
+
+_SALT_LENGTH: int = 16
+# a derived key length of scrypt hashes, it keeps a hash shorter than the "passwordHash" column
+_SCRYPT_KEY_LENGTH: int = 32
+
+
+def generate_password_hash(password: str, method: str, params: t.Dict[str, int]) -> str:
+    """Hashes a password
+
+    Notes:
+        PBKDF2 hashes are Werkzeug hashes: "pbkdf2:sha256:<iterations>$<salt>$<hash>".
+        Scrypt hashes have the same layout: "scrypt:<n>:<r>:<p>$<salt>$<hash>".
+        Argon2 hashes are argon2-cffi (PHC string format) hashes.
+
+    Args:
+        password (str): Password
+        method (str): One of PasswordHashMethods values
+        params (dict): Method cost parameters, see PasswordHasher.get_params
+
+    Returns:
+        str: Password hash
+    """
+    method = PasswordHashMethods(method)
+    if method is PasswordHashMethods.PBKDF2:
+        return security.generate_password_hash(
+            password,
+            method=f'pbkdf2:sha256:{params["iterations"]}',
+            salt_length=_SALT_LENGTH,
+        )
+    if method is PasswordHashMethods.SCRYPT:
+        salt = security.gen_salt(_SALT_LENGTH)
+        key = _derive_scrypt_key(password, salt, params['n'], params['r'], params['p'], _SCRYPT_KEY_LENGTH)
+        return f'scrypt:{params["n"]}:{params["r"]}:{params["p"]}${salt}${key.hex()}'
+    return create_argon2_hasher(params).hash(password)
+
+
+def check_password_hash(password_hash: str, password: str) -> bool:
+    """Checks a password against a password hash of any supported method
+
+    Args:
+        password_hash (str): Password hash
+        password (str): Password
+
+    Returns:
+        bool: True if the password matches the hash
+    """
+    if password_hash.startswith('scrypt:'):
+        try:
+            method, salt, key = password_hash.split('$', 2)
+            _, n, r, p = method.split(':')
+            expected_key = bytes.fromhex(key)
+        except ValueError:
+            return False
+        actual_key = _derive_scrypt_key(password, salt, int(n), int(r), int(p), len(expected_key))
+        return hmac.compare_digest(actual_key, expected_key)
+    if password_hash.startswith('$argon2'):
+        if argon2 is None:
+            logger.error('Can not check an argon2 password hash, argon2-cffi is not installed')
+            return False
+        try:
+            return argon2.PasswordHasher().verify(password_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+    return security.check_password_hash(password_hash, password)
+
+
+def _derive_scrypt_key(password: str, salt: str, n: int, r: int, p: int, key_length: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt.encode(),
+        n=n,
+        r=r,
+        p=p,
+        maxmem=132 * n * r * p,
+        dklen=key_length,
+    )
+
+
+def create_argon2_hasher(params: t.Dict[str, int]) -> t.Any:
+    if argon2 is None:
+        raise RuntimeError('argon2-cffi must be installed to use the argon2 password hash method')
+    return argon2.PasswordHasher(
+        time_cost=params['time_cost'],
+        memory_cost=params['memory_cost'],
+        parallelism=params['parallelism'],
+    )
+
+
+def argon2_needs_rehash(password_hash: str, params: t.Dict[str, int]) -> bool:
+    """Checks if an argon2 password hash was made with other cost parameters
+
+    Args:
+        password_hash (str): Password hash
+        params (dict): argon2 cost parameters
+
+    Returns:
+        bool: True if the password should be hashed again
+    """
+    try:
+        return create_argon2_hasher(params).check_needs_rehash(password_hash)
+    except InvalidHash:
+        return True
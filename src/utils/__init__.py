@@ -1,6 +1,25 @@
 from .email_sender import EmailSender
 from .mappers import GoogleProfileMapper
+from .password_hashers import PasswordHashMethods, PasswordHasher
+from .principal_cache import UserPrincipal, UserPrincipalCache
+from .rate_limiters import RateLimiter, RateLimiterBackends
 from .social_login.google_login import GoogleLoginUtil, create_google_config
-from .storage_controllers import RefreshTokenStorageController
+from .storage_controllers import (
+    InMemoryRefreshTokenStorageController,
+    RefreshTokenStorageController,
+    ResetPasswordEmailStatuses,
+    ResetPasswordEmailStorageController,
+    TokenStorageBackends,
+    TokenStorageModes,
+    create_refresh_token_storage_controller,
+)
 from .token_decoders import JWTDecoder, ResetPasswordTokenDecoder
-from .token_generators import AccessTokenGenerator, RefreshTokenGenerator, ResetPasswordTokenGenerator
+from .token_generators import (
+    AccessTokenGenerator,
+    AccessTokenProfiles,
+    OpaqueRefreshTokenGenerator,
+    RefreshTokenGenerator,
+    RefreshTokenTypes,
+    ResetPasswordTokenGenerator,
+    create_refresh_token_generator,
+)
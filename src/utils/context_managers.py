@@ -1,16 +1,33 @@
-from redis import Redis
+import os
+import threading
+import typing as t
+
+from redis import ConnectionPool, Redis
+from redis.commands.core import Script
+
+from .metrics import InstrumentedRedis
+
+
+def create_script(script: str) -> Script:
+    """Creates a Lua script that is not bound to a client, so it is built and hashed (SHA1) once
+
+    Notes:
+        The script must be called with a client: script(keys=[...], args=[...], client=redis_conn).
+        It is loaded by the client on the first call (EVALSHA falls back to SCRIPT LOAD).
+
+    Args:
+        script (str): Lua script
+
+    Returns:
+        Script: Script
+    """
+    return Script(None, script.encode())
 
 
 class RedisContextManager:
-    """Context manager for a redis connector"""
-    def __init__(self, host: str, port: int, db: int, password: str = '') -> None:
-        self._redis = Redis(
-            host=host,
-            port=port,
-            password=password,
-            db=db,
-            decode_responses=True
-        )
+    """Context manager for a redis connector that borrows connections from a shared pool and reports commands"""
+    def __init__(self, connection_pool: ConnectionPool) -> None:
+        self._redis = InstrumentedRedis(connection_pool=connection_pool)
 
     def __enter__(self) -> Redis:
         return self._redis
@@ -20,3 +37,105 @@ class RedisContextManager:
 
         if exc_type:
             raise exc_type
+
+
+class ProcessConnectionPool:
+    def __init__(self, **connection_pool_context: t.Any) -> None:
+        """Holder of a redis connection pool of the current process.
+
+        Notes:
+            The pool is created lazily and re-created after a fork, so connections opened
+            by a parent process are never reused by its children.
+
+        Args:
+            **connection_pool_context: ConnectionPool arguments
+        """
+        self._connection_pool_context: t.Dict[str, t.Any] = connection_pool_context
+        self._connection_pool: t.Optional[ConnectionPool] = None
+        self._connection_pool_pid: t.Optional[int] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: t.Dict[str, t.Any], db: int) -> 'ProcessConnectionPool':
+        """Creates a connection pool holder with Redis settings of the app config
+
+        Args:
+            config (dict): app config
+            db (int): Redis DB number
+
+        Returns:
+            ProcessConnectionPool: connection pool holder
+        """
+        return cls(
+            host=config['REDIS_HOST'],
+            port=config['REDIS_PORT'],
+            password=config['REDIS_PWD'],
+            db=db,
+            max_connections=config['REDIS_POOL_MAX_CONNECTIONS'],
+            socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+            socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+            health_check_interval=config['REDIS_HEALTH_CHECK_INTERVAL'],
+            decode_responses=True,
+        )
+
+    def get(self) -> ConnectionPool:
+        """Gets a connection pool of the current process
+
+        Returns:
+            ConnectionPool: connection pool
+        """
+        pid = os.getpid()
+        if self._connection_pool is None or self._connection_pool_pid != pid:
+            with self._lock:
+                if self._connection_pool is None or self._connection_pool_pid != pid:
+                    self._connection_pool = ConnectionPool(**self._connection_pool_context)
+                    self._connection_pool_pid = pid
+        return self._connection_pool
+
+    def warm_up(self, connections: int = 1) -> None:
+        """Opens connections of the current process pool in advance, so first requests do not wait for them
+
+        Args:
+            connections (int): Number of connections, it is limited by the pool size
+
+        Returns:
+            None
+        """
+        pool = self.get()
+        opened = []
+        try:
+            for _ in range(min(connections, pool.max_connections)):
+                connection = pool.get_connection('PING')
+                opened.append(connection)
+                connection.send_command('PING')
+                connection.read_response()
+        finally:
+            for connection in opened:
+                pool.release(connection)
+
+    def reset(self) -> None:
+        """Drops the current connection pool, so a new one is created on the next call
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._connection_pool is not None and self._connection_pool_pid == os.getpid():
+                self._connection_pool.disconnect()
+            self._connection_pool = None
+            self._connection_pool_pid = None
+
+    def get_stats(self) -> t.Dict[str, int]:
+        """Gets connection pool usage stats of the current process
+
+        Returns:
+            dict: "created", "in_use", "idle" and "max" connection counters
+        """
+        pool = self.get()
+        with pool._lock:
+            return {
+                'created': pool._created_connections,
+                'in_use': len(pool._in_use_connections),
+                'idle': len(pool._available_connections),
+                'max': pool.max_connections,
+            }
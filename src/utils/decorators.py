@@ -3,12 +3,13 @@ import typing as t
 from http import HTTPStatus
 
 import jwt
-from flask import request, abort, Response
+from flask import request, abort, make_response, Response, Request
+from werkzeug import exceptions as exc
 
 import log
-import run
 import src.utils.request_helpers as helpers
 from src.models import User
+from src.utils.principal_cache import UserPrincipal
 
 logger = log.APILogger(__name__)
 
@@ -19,12 +20,22 @@ def required_access_token(func: t.Callable) -> t.Callable:
     Args:
         func (callable): View function
 
+    Notes:
+        A view function gets a UserPrincipal, not a User model object.
+        A principal is made from the token claims of a self-contained ("full" profile) access token,
+        otherwise (or if the claims are stale) it is served from utils.UserPrincipalCache,
+        so most requests do not touch the DB, and most requests with a self-contained token do not leave the process.
+        A self-contained token issued before a password change or an activation status change is rejected,
+        other workers may accept it for a while, see utils.UserPrincipalCache.
+
     Returns:
         callable: A decorated view function that required a JWT auth
     """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs) -> Response:
+        import run
+
         token = helpers.get_bearer_auth_token(request)
 
         if not token:
@@ -34,7 +45,9 @@ def required_access_token(func: t.Callable) -> t.Callable:
         try:
             data = run.jwt_decoder.decode_token(token)
             user_id = data.get('rid')
-            user = User.query.filter_by(id=user_id, ).first()
+            claims_user = user = UserPrincipal.from_claims(data)
+            if not user or run.user_principal_cache.is_stale(user):
+                user = run.user_principal_cache.get_or_load(user_id, lambda: User.get_by_id(user_id))
         except (jwt.DecodeError, jwt.ExpiredSignatureError) as e:
             logger.warning(e)
             return abort(HTTPStatus.UNAUTHORIZED, f'{e}')
@@ -46,7 +59,61 @@ def required_access_token(func: t.Callable) -> t.Callable:
             if not user:
                 logger.error(f'User with id: {user_id} does not exist or inactive')
                 abort(HTTPStatus.UNAUTHORIZED, f'Invalid user')
+            if claims_user and (claims_user.password_epoch, claims_user.is_active) != \
+                    (user.password_epoch, user.is_active):
+                logger.warning('Access token of user with id: %s predates a password or status change', user_id)
+                abort(HTTPStatus.UNAUTHORIZED, 'Token was revoked')
 
         return func(user, *args, **kwargs)
 
     return wrapper
+
+
+def rate_limited(
+        name: str,
+        key_func: t.Callable[[Request], t.Optional[str]],
+        failures_only: bool = False,
+) -> t.Callable:
+    """Creates a decorator that rate limits a view function by a sliding window limit
+
+    Args:
+        name (str): Limit name, the limit is set by the "RATE_LIMIT_<name>" config value
+        key_func (callable): Gets a rate limited entity (e.g. client IP) from a request,
+            requests without it are not limited, see utils.rate_limiters
+        failures_only (bool): Count only UNAUTHORIZED (401) responses, e.g. failed logins,
+            so successful requests of a user never exceed the limit
+
+    Notes:
+        TOO_MANY_REQUESTS (429) response with a "Retry-After" header if the limit is exceeded.
+        Every decorator takes one Redis round trip (two for a failed request with "failures_only"),
+        so limits by several keys are stacked.
+
+    Returns:
+        callable: A decorator
+    """
+
+    def decorator(func: t.Callable) -> t.Callable:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Response:
+            import run
+
+            key = key_func(request)
+            if failures_only:
+                retry_after = run.rate_limiter.peek(name, key)
+            else:
+                retry_after = run.rate_limiter.check(name, key)
+            if retry_after:
+                logger.warning('Rate limit %s is exceeded, retry after %s s.', name, retry_after)
+                raise exc.TooManyRequests('Too many requests, try again later.', retry_after=retry_after)
+            if not failures_only:
+                return func(*args, **kwargs)
+
+            response = make_response(func(*args, **kwargs))
+            if response.status_code == HTTPStatus.UNAUTHORIZED:
+                run.rate_limiter.check(name, key)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,42 +1,246 @@
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
 import typing as t
 
 from flask import Flask
 from flask_mail import Mail, Message
 
 import log
-import run
+from src.exceptions import CapacityExceededError
 
 logger = log.APILogger(__name__)
 
 
+class _QueuedEmail(t.NamedTuple):
+    message: Message
+    enqueued_at: float
+    attempt: int = 0
+
+
 class EmailSender:
+    _STOP = object()
+    _QUEUE_FULL_RETRY_AFTER: int = 5
+
     def __init__(self, config: t.Dict[t.Any, t.Any], flask_app: Flask) -> None:
+        """Sends emails from a background queue.
+
+        Notes:
+            A request thread only enqueues a message, "EMAIL_WORKERS" threads send them
+            (0 sends in a request thread). A worker sends a batch of up to "MAIL_MAX_EMAILS" queued messages
+            over one SMTP connection. A failed message is retried "EMAIL_MAX_RETRIES" times
+            after "EMAIL_RETRY_BACKOFF" * 2 ** attempt seconds. If "EMAIL_QUEUE_SIZE" messages are waiting,
+            a new one is rejected with CapacityExceededError.
+            Workers are started lazily and again after a fork, queued messages are sent at exit.
+            Messages waiting for a retry are sent at exit too, without the rest of their backoff,
+            a message that fails again at exit (or does not fit the queue) is counted as failed.
+
+        Args:
+            config (dict): app config
+            flask_app (Flask): Flask app
+        """
         self._app_config: t.Dict[t.Any, t.Any] = config
+        self._flask_app: Flask = flask_app
         self._mail: Mail = Mail(flask_app)
+        self._workers_count: int = self._app_config['EMAIL_WORKERS']
+        self._batch_size: int = self._app_config['MAIL_MAX_EMAILS'] or self._app_config['EMAIL_QUEUE_SIZE']
+        self._max_retries: int = self._app_config['EMAIL_MAX_RETRIES']
+        self._retry_backoff: float = self._app_config['EMAIL_RETRY_BACKOFF']
+        self._queue: t.Optional[queue.Queue] = None
+        self._workers: t.List[threading.Thread] = []
+        self._workers_pid: t.Optional[int] = None
+        self._workers_lock: threading.Lock = threading.Lock()
+        # retry id -> (a timer that enqueues the message, message)
+        self._retries: t.Dict[int, t.Tuple[threading.Timer, _QueuedEmail]] = {}
+        self._retry_ids: t.Iterator[int] = itertools.count()
+        self._retries_lock: threading.Lock = threading.Lock()
+        self._is_stopping: bool = False
+        self._stats: t.Dict[str, int] = {'sent': 0, 'failed': 0, 'retried': 0}
+        self._stats_lock: threading.Lock = threading.Lock()
+        atexit.register(self.shutdown)
 
     def send_password_reset_email(self, email_address: str, token: str) -> None:
-        """Sends an email with a reset token to a receiver.
+        """Enqueues an email with a reset token to a receiver.
 
         Args:
             email_address (str): Receiver email address
             token (str): Password reset token
+
+        Raises:
+            CapacityExceededError: if the email queue is full
         """
 
+        import run
+
         context = self._create_email_context(email_address, token)
-        logger.info(f'Sending am email to with password recovery information to {email_address}...')
+        logger.info('Sending am email to with password recovery information to %s...', email_address)
         message = Message(**context)
 
         if run.app.config['DEBUG'] == 1:
             print(message)
             logger.debug(
-                f'Sending a fake email to with password recovery information to {email_address}...\nMessage: {message}'
+                'Sending a fake email to with password recovery information to %s...\nMessage: %s',
+                email_address,
+                message,
             )
             return
 
+        email = _QueuedEmail(message, time.monotonic())
+        if not self._workers_count:
+            self._send_batch([email])
+            return
+        self._enqueue(email)
+
+    def get_stats(self) -> t.Dict[str, int]:
+        """Gets email queue stats of the current process
+
+        Returns:
+            dict: "queued" messages, messages "waiting_retry" and "sent", "failed" (after all retries)
+                and "retried" counters
+        """
+        is_current_process = self._queue is not None and self._workers_pid == os.getpid()
+        queued = self._queue.qsize() if is_current_process else 0
+        with self._retries_lock:
+            waiting_retry = len(self._retries) if is_current_process else 0
+        with self._stats_lock:
+            return {'queued': queued, 'waiting_retry': waiting_retry, **self._stats}
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Sends queued messages and messages waiting for a retry, and stops workers of the current process
+
+        Args:
+            timeout (float): Max seconds to wait for every worker
+
+        Returns:
+            None
+        """
+        with self._workers_lock:
+            if self._workers_pid == os.getpid():
+                self._is_stopping = True
+                self._flush_retries()
+                for _ in self._workers:
+                    self._queue.put(self._STOP)
+                for worker in self._workers:
+                    worker.join(timeout)
+                self._is_stopping = False
+            else:
+                # timers of a parent process do not exist after a fork
+                with self._retries_lock:
+                    self._retries.clear()
+            self._workers = []
+            self._workers_pid = None
+
+    def _enqueue(self, email: _QueuedEmail) -> None:
+        if self._workers_pid != os.getpid():
+            self._start_workers()
         try:
-            self._mail.send(message)
-        except Exception as e:
-            logger.error(f'Failed to send an email to {email_address}.\nError: {e}')
+            self._queue.put_nowait(email)
+        except queue.Full:
+            logger.error('Failed to enqueue an email to %s, the queue is full.', email.message.recipients)
+            raise CapacityExceededError('Email queue is full.', self._QUEUE_FULL_RETRY_AFTER)
+
+    def _start_workers(self) -> None:
+        with self._workers_lock:
+            pid = os.getpid()
+            if self._workers_pid == pid:
+                return
+            logger.info('Starting %s email workers...', self._workers_count)
+            self._queue = queue.Queue(self._app_config['EMAIL_QUEUE_SIZE'])
+            self._workers = [
+                threading.Thread(target=self._work, name=f'EmailWorker-{i}', daemon=True)
+                for i in range(self._workers_count)
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._workers_pid = pid
+
+    def _work(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = []
+            email = self._queue.get()
+            while True:
+                if email is self._STOP:
+                    stopped = True
+                    break
+                batch.append(email)
+                if len(batch) >= self._batch_size:
+                    break
+                try:
+                    email = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._send_batch(batch)
+
+    def _send_batch(self, batch: t.List[_QueuedEmail]) -> None:
+        import run
+
+        sent = 0
+        with self._flask_app.app_context():
+            try:
+                with self._mail.connect() as connection:
+                    for email in batch:
+                        started_at = time.perf_counter()
+                        connection.send(email.message)
+                        run.metrics.observe_dependency('smtp', 'send', time.perf_counter() - started_at)
+                        run.metrics.observe_dependency('smtp', 'delivery', time.monotonic() - email.enqueued_at)
+                        sent += 1
+            except Exception as e:
+                # the connection is broken, so the rest of the batch is retried too
+                logger.error('Failed to send %s emails. Error: %s', len(batch) - sent, e)
+                for email in batch[sent:]:
+                    self._retry(email)
+            finally:
+                self._increment_stat('sent', sent)
+
+    def _retry(self, email: _QueuedEmail) -> None:
+        if email.attempt >= self._max_retries or not self._workers_count or self._is_stopping:
+            self._increment_stat('failed')
+            logger.error(
+                'Failed to send an email to %s after %s attempts.', email.message.recipients, email.attempt + 1
+            )
+            return
+        self._increment_stat('retried')
+        retry = email._replace(attempt=email.attempt + 1)
+        retry_id = next(self._retry_ids)
+        timer = threading.Timer(self._retry_backoff * 2 ** email.attempt, self._enqueue_retry, (retry_id,))
+        timer.daemon = True
+        with self._retries_lock:
+            self._retries[retry_id] = (timer, retry)
+        timer.start()
+
+    def _enqueue_retry(self, retry_id: int) -> None:
+        with self._retries_lock:
+            _, email = self._retries.pop(retry_id, (None, None))
+        if email is None:
+            # it was flushed by "shutdown"
+            return
+        try:
+            self._enqueue(email)
+        except CapacityExceededError:
+            self._increment_stat('failed')
+
+    def _flush_retries(self) -> None:
+        with self._retries_lock:
+            retries = list(self._retries.values())
+            self._retries.clear()
+        if retries:
+            logger.info('Sending %s emails waiting for a retry before exit...', len(retries))
+        for timer, email in retries:
+            timer.cancel()
+            try:
+                self._queue.put_nowait(email)
+            except queue.Full:
+                self._increment_stat('failed')
+                logger.error('Failed to send an email to %s before exit, the queue is full.', email.message.recipients)
+
+    def _increment_stat(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
 
     def _create_email_context(self, email_address: str, token: str) -> t.Dict[str, t.Any]:
         body = f'Please, use that token to reset your password: {token}'
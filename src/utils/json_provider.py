@@ -0,0 +1,150 @@
+import datetime
+import decimal
+import json
+import typing as t
+import uuid
+from enum import Enum, unique
+
+from flask import Response, current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional dependency
+    orjson = None
+
+EXTENSION_NAME: str = 'json_provider'
+
+
+@unique
+class JSONProviders(Enum):
+    # orjson if it is installed, otherwise the standard library
+    AUTO = 'auto'
+    ORJSON = 'orjson'
+    STDLIB = 'json'
+
+
+def _default(obj: t.Any) -> t.Any:
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, decimal.Decimal)):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class JSONProvider:
+    name: str = JSONProviders.STDLIB.value
+    mimetype: str = 'application/json'
+
+    def __init__(self, sort_keys: bool = False, sort_errors_keys: bool = False) -> None:
+        """Serializes response bodies with the standard library json module
+
+        Args:
+            sort_keys (bool): Sort keys of objects by default
+            sort_errors_keys (bool): Sort keys of error bodies
+        """
+        self.sort_keys: bool = sort_keys
+        self.sort_errors_keys: bool = sort_errors_keys
+
+    def dumps(self, obj: t.Any, sort_keys: t.Optional[bool] = None) -> bytes:
+        """Serializes an object to compact JSON
+
+        Args:
+            obj (any): Object
+            sort_keys (bool, optional): Sort keys of objects, the provider default is used if it is None
+
+        Returns:
+            bytes: UTF-8 JSON
+        """
+        sort_keys = self.sort_keys if sort_keys is None else sort_keys
+        return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'), default=_default).encode()
+
+    def response(self, obj: t.Any, status: t.Optional[int] = None, sort_keys: t.Optional[bool] = None) -> Response:
+        """Creates a JSON response
+
+        Args:
+            obj (any): Response body
+            status (int, optional): Status code
+            sort_keys (bool, optional): Sort keys of objects, the provider default is used if it is None
+
+        Returns:
+            Response: Response
+        """
+        return self.raw_response(self.dumps(obj, sort_keys), status)
+
+    def raw_response(self, body: bytes, status: t.Optional[int] = None) -> Response:
+        """Creates a JSON response from a serialized body
+
+        Args:
+            body (bytes): UTF-8 JSON
+            status (int, optional): Status code
+
+        Returns:
+            Response: Response
+        """
+        return current_app.response_class(body, status=status, mimetype=self.mimetype)
+
+
+class OrjsonProvider(JSONProvider):
+    name: str = JSONProviders.ORJSON.value
+
+    def __init__(self, sort_keys: bool = False, sort_errors_keys: bool = False) -> None:
+        """Serializes response bodies with orjson, it is several times faster than the json module
+
+        Args:
+            sort_keys (bool): Sort keys of objects by default
+            sort_errors_keys (bool): Sort keys of error bodies
+        """
+        if orjson is None:
+            raise ImportError('orjson is not installed, "pip install orjson" or use the "json" provider.')
+        super().__init__(sort_keys, sort_errors_keys)
+
+    def dumps(self, obj: t.Any, sort_keys: t.Optional[bool] = None) -> bytes:
+        sort_keys = self.sort_keys if sort_keys is None else sort_keys
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+
+
+def create_json_provider(config: t.Dict[str, t.Any], provider: t.Optional[str] = None) -> JSONProvider:
+    """Creates a JSON provider by the "JSON_PROVIDER" config value
+
+    Args:
+        config (dict): app config
+        provider (str, optional): Provider name, overrides "JSON_PROVIDER"
+
+    Returns:
+        JSONProvider: JSONProvider or OrjsonProvider
+    """
+    provider = JSONProviders(provider or config['JSON_PROVIDER'])
+    if provider is JSONProviders.ORJSON or (provider is JSONProviders.AUTO and orjson is not None):
+        return OrjsonProvider(config['JSON_SORT_KEYS'], config['JSON_SORT_ERRORS_KEYS'])
+    return JSONProvider(config['JSON_SORT_KEYS'], config['JSON_SORT_ERRORS_KEYS'])
+
+
+def get_json_provider() -> JSONProvider:
+    """Gets a JSON provider of the current app
+
+    Returns:
+        JSONProvider: JSON provider
+    """
+    return current_app.extensions[EXTENSION_NAME]
+
+
+def jsonify(*args: t.Any, **kwargs: t.Any) -> Response:
+    """A replacement of flask.jsonify that serializes a response body with the JSON provider of the current app
+
+    Args:
+        *args: A single object or several objects that are serialized as a list
+        **kwargs: Object fields, if no args are passed
+
+    Returns:
+        Response: Response
+    """
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    if len(args) == 1:
+        obj = args[0]
+    else:
+        obj = args or kwargs
+    return get_json_provider().response(obj)
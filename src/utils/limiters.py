@@ -0,0 +1,135 @@
+import contextlib
+import threading
+import time
+import typing as t
+import uuid
+
+from redis.commands.core import Script
+
+import log
+from src.exceptions import CapacityExceededError
+from .context_managers import ProcessConnectionPool, RedisContextManager, create_script
+
+logger = log.APILogger(__name__)
+
+
+class ConcurrencyLimiter:
+    _KEY_PREFIX: str = 'concurrencyLimiter:'
+
+    # KEYS: leases sorted set. ARGV: now (ms), lease timeout (ms), limit, lease id
+    _ACQUIRE_SCRIPT: str = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        return 1
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_concurrency: int,
+            max_waiting: int,
+            wait_timeout: float,
+            retry_after: int,
+            global_limit: int = 0,
+            connection_pool: t.Optional[ProcessConnectionPool] = None,
+            lease_timeout: float = 30.0,
+    ) -> None:
+        """Admission control for CPU-heavy operations.
+
+        Notes:
+            At most "max_concurrency" operations of a worker run at once, at most "max_waiting"
+            callers wait for a slot (for up to "wait_timeout" seconds) and the others are rejected at once.
+            An optional "global_limit" is shared by all workers via Redis: every running operation holds
+            a lease in a sorted set, leases of crashed workers expire after "lease_timeout" seconds.
+            If Redis is unavailable the global limit is not enforced.
+
+        Args:
+            name (str): Limiter name, it is a part of the Redis key
+            max_concurrency (int): Max number of running operations per worker
+            max_waiting (int): Max number of callers waiting for a slot per worker
+            wait_timeout (float): Max wait time in seconds
+            retry_after (int): "Retry-After" value in seconds for rejected callers
+            global_limit (int): Max number of running operations of all workers, 0 disables the limit
+            connection_pool (ProcessConnectionPool, optional): Redis connection pool for the global limit
+            lease_timeout (float): Lifetime of a global limit lease in seconds
+        """
+        self._name: str = name
+        self._slots: threading.BoundedSemaphore = threading.BoundedSemaphore(max_concurrency)
+        self._max_waiting: int = max_waiting
+        self._wait_timeout: float = wait_timeout
+        self._retry_after: int = retry_after
+        self._waiting: int = 0
+        self._waiting_lock: threading.Lock = threading.Lock()
+        self._global_limit: int = global_limit if connection_pool else 0
+        self._connection_pool: t.Optional[ProcessConnectionPool] = connection_pool
+        self._lease_timeout_ms: int = int(lease_timeout * 1000)
+        self._acquire_script: Script = create_script(self._ACQUIRE_SCRIPT)
+
+    @contextlib.contextmanager
+    def acquire(self) -> t.Iterator[None]:
+        """Runs a block of code in a limiter slot
+
+        Raises:
+            CapacityExceededError: if there is no free slot
+        """
+        self._acquire_local_slot()
+        try:
+            lease_id = self._acquire_global_lease()
+            try:
+                yield
+            finally:
+                self._release_global_lease(lease_id)
+        finally:
+            self._slots.release()
+
+    def _acquire_local_slot(self) -> None:
+        if self._slots.acquire(blocking=False):
+            return
+        with self._waiting_lock:
+            if self._waiting >= self._max_waiting:
+                raise self._create_error('wait queue is full')
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self._wait_timeout)
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+        if not acquired:
+            raise self._create_error('wait timeout')
+
+    def _acquire_global_lease(self) -> t.Optional[str]:
+        if not self._global_limit:
+            return None
+        lease_id = uuid.uuid4().hex
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                acquired = self._acquire_script(
+                    keys=[self._KEY_PREFIX + self._name],
+                    args=[int(time.time() * 1000), self._lease_timeout_ms, self._global_limit, lease_id],
+                    client=redis_conn,
+                )
+        except Exception as e:
+            logger.warning(
+                'Failed to acquire a global "%s" lease, the global limit is skipped. Error: %s', self._name, e
+            )
+            return None
+        if not acquired:
+            raise self._create_error('global limit is reached')
+        return lease_id
+
+    def _release_global_lease(self, lease_id: t.Optional[str]) -> None:
+        if not lease_id:
+            return
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                redis_conn.zrem(self._KEY_PREFIX + self._name, lease_id)
+        except Exception as e:
+            logger.warning('Failed to release a global "%s" lease. Error: %s', self._name, e)
+
+    def _create_error(self, reason: str) -> CapacityExceededError:
+        logger.warning('"%s" operation was rejected: %s', self._name, reason)
+        return CapacityExceededError(f'Server is busy, please retry later ({reason}).', self._retry_after)
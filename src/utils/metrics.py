@@ -0,0 +1,602 @@
+import atexit
+import bisect
+import contextlib
+import fcntl
+import functools
+import hmac
+import json
+import os
+import threading
+import time
+import typing as t
+
+from flask import Response, g, has_request_context, request
+from redis import Redis
+from redis.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import log
+
+logger = log.APILogger(__name__)
+
+# (metric name, sorted label pairs)
+_SeriesKey = t.Tuple[str, t.Tuple[t.Tuple[str, str], ...]]
+
+REQUEST_DURATION_METRIC: str = 'auth_api_http_request_duration_seconds'
+DEPENDENCY_DURATION_METRIC: str = 'auth_api_dependency_duration_seconds'
+
+_HELP: t.Dict[str, str] = {
+    REQUEST_DURATION_METRIC: 'HTTP request latency by endpoint, method and status code.',
+    DEPENDENCY_DURATION_METRIC: 'Latency of Redis, SQL, password hashing and JWT operations.',
+}
+
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'sum', 'count')
+
+    def __init__(self, buckets_count: int) -> None:
+        # non-cumulative, the last one is "+Inf"
+        self.bucket_counts: t.List[int] = [0] * (buckets_count + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+
+class Metrics:
+    _CONTENT_TYPE: str = 'text/plain; version=0.0.4; charset=utf-8'
+    # histograms of all exited processes, see "retire_dump"
+    _RETIRED_DUMP: str = 'retired.json'
+    _DUMPS_LOCK: str = 'dumps.lock'
+
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Latency histograms of requests and dependencies rendered in the Prometheus text format.
+
+        Notes:
+            Every process keeps its own histograms. If "METRICS_DIR" is set, every process dumps them
+            to "<METRICS_DIR>/<pid>-<start time>.json" at most once per "METRICS_FLUSH_INTERVAL" seconds
+            (and at exit), and a scrape of any gunicorn worker sums the dumps of all workers. A dump of
+            an exited worker is added to one "retired.json" dump and removed ("retire_dump"),
+            so sums stay monotonic, the directory should be cleaned before the server starts.
+            Gauges (e.g. connection pool stats) are reported per process with a "pid" label,
+            gauges of processes that did not dump them for 3 flush intervals are skipped.
+            Histograms inherited by a forked process are dropped.
+
+            If "SERVER_TIMING_ENABLED" is set, dependency latencies of a request are also summed by operation
+            and logged as one line per request. They are returned in a "Server-Timing" response header only
+            to requests with a "SERVER_TIMING_HEADER" header equal to "SERVER_TIMING_TOKEN" (if it is set),
+            timings of other clients could tell e.g. an existing username from a missing one.
+
+            SQL statements and Redis commands (pipelines) slower than "SLOW_SQL_QUERY_MS" and
+            "SLOW_REDIS_COMMAND_MS" are logged with redacted parameters, requests with more than
+            "REQUEST_SQL_QUERIES_WARNING" SQL statements or "REQUEST_REDIS_COMMANDS_WARNING" Redis round trips
+            are logged as possible N+1 patterns. Zero values disable the checks.
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self.enabled: bool = self._app_config['METRICS_ENABLED']
+        self.server_timing_enabled: bool = self._app_config['SERVER_TIMING_ENABLED']
+        self._server_timing_header: str = self._app_config['SERVER_TIMING_HEADER']
+        self._server_timing_token: str = self._app_config['SERVER_TIMING_TOKEN']
+        # dependency -> seconds, 0 disables the slow command log
+        self._slow_command_thresholds: t.Dict[str, float] = {
+            'sql': self._app_config['SLOW_SQL_QUERY_MS'] / 1000,
+            'redis': self._app_config['SLOW_REDIS_COMMAND_MS'] / 1000,
+        }
+        # dependency -> max commands per request, 0 disables the check
+        self._request_command_limits: t.Dict[str, int] = {
+            'sql': self._app_config['REQUEST_SQL_QUERIES_WARNING'],
+            'redis': self._app_config['REQUEST_REDIS_COMMANDS_WARNING'],
+        }
+        self.is_counting_commands: bool = any(self._request_command_limits.values())
+        # False if dependency latencies are not needed at all
+        self.is_timing: bool = (
+            self.enabled
+            or self.server_timing_enabled
+            or self.is_counting_commands
+            or any(self._slow_command_thresholds.values())
+        )
+        self._buckets: t.List[float] = sorted(
+            float(bucket) for bucket in self._app_config['METRICS_LATENCY_BUCKETS'].split(',')
+        )
+        self._dir: str = self._app_config['METRICS_DIR']
+        self._flush_interval: float = self._app_config['METRICS_FLUSH_INTERVAL']
+        self._histograms: t.Dict[_SeriesKey, _Histogram] = {}
+        # gauge group name -> a callable that returns gauge values
+        self._gauge_groups: t.Dict[str, t.Callable[[], t.Dict[str, float]]] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._pid: int = os.getpid()
+        self._next_flush_at: float = 0.0
+        self._dump_pid: t.Optional[int] = None
+        self._dump_filename: str = ''
+        os.register_at_fork(after_in_child=self._reset_lock)
+        if self.enabled and self._dir:
+            os.makedirs(self._dir, exist_ok=True)
+            atexit.register(self.flush)
+
+    @property
+    def content_type(self) -> str:
+        """str: a content type of the rendered metrics"""
+        return self._CONTENT_TYPE
+
+    def register_gauges(self, group: str, collect: t.Callable[[], t.Dict[str, float]]) -> None:
+        """Registers a group of gauges that are collected on every render and flush
+
+        Args:
+            group (str): Group name, a gauge name is "auth_api_<group>_<key>"
+            collect (callable): Returns gauge values by keys
+
+        Returns:
+            None
+        """
+        self._gauge_groups[group] = collect
+
+    def is_server_timing_trusted(self) -> bool:
+        """Checks if the current request may get a "Server-Timing" header
+
+        Returns:
+            bool: True if the request has a "SERVER_TIMING_HEADER" header equal to "SERVER_TIMING_TOKEN"
+        """
+        if not self._server_timing_token:
+            return False
+        token = request.headers.get(self._server_timing_header)
+        return bool(token) and hmac.compare_digest(token, self._server_timing_token)
+
+    def observe_request(self, endpoint: str, method: str, status: int, duration: float) -> None:
+        """Records a request latency
+
+        Args:
+            endpoint (str): Flask endpoint
+            method (str): HTTP method
+            status (int): Response status code
+            duration (float): Latency in seconds
+
+        Returns:
+            None
+        """
+        labels = (('endpoint', endpoint), ('method', method), ('status', str(status)))
+        self._observe((REQUEST_DURATION_METRIC, labels), duration)
+        if self._dir and time.monotonic() >= self._next_flush_at:
+            self.flush()
+
+    def observe_dependency(self, dependency: str, operation: str, duration: float) -> None:
+        """Records a dependency operation latency
+
+        Args:
+            dependency (str): Dependency name, e.g. "redis"
+            operation (str): Operation name, e.g. "get_user_id_by_refresh_token"
+            duration (float): Latency in seconds
+
+        Returns:
+            None
+        """
+        if self.enabled:
+            labels = (('dependency', dependency), ('operation', operation))
+            self._observe((DEPENDENCY_DURATION_METRIC, labels), duration)
+        if self.server_timing_enabled and has_request_context():
+            phases = g.get('request_phases')
+            if phases is not None:
+                phase = phases.setdefault(f'{dependency}.{operation}', [0.0, 0])
+                phase[0] += duration
+                phase[1] += 1
+
+    def observe_command(self, dependency: str, command: str, params: t.Any, duration: float) -> None:
+        """Counts a SQL statement or a Redis command of a request and logs it if it is slow
+
+        Args:
+            dependency (str): "sql" or "redis"
+            command (str): SQL statement or Redis command name
+            params (any): Statement or command parameters, they are redacted
+            duration (float): Latency in seconds
+
+        Returns:
+            None
+        """
+        in_request = has_request_context()
+        if self.is_counting_commands and in_request:
+            commands = g.get('request_commands')
+            if commands is not None:
+                commands[dependency] = commands.get(dependency, 0) + 1
+        threshold = self._slow_command_thresholds.get(dependency)
+        if threshold and duration >= threshold:
+            logger.warning(
+                'Slow %s command: %.3fms endpoint=%s command=%s params=%s',
+                dependency,
+                duration * 1000,
+                request.endpoint if in_request else None,
+                command,
+                _redact(params),
+            )
+
+    def check_request_commands(self, endpoint: str, commands: t.Dict[str, int]) -> None:
+        """Logs dependencies that got too many commands during one request
+
+        Args:
+            endpoint (str): Flask endpoint
+            commands (dict): Dependency -> commands count
+
+        Returns:
+            None
+        """
+        for dependency, count in commands.items():
+            limit = self._request_command_limits.get(dependency)
+            if limit and count > limit:
+                logger.warning(
+                    'Possible N+1 pattern: %s %s commands in one request, endpoint=%s',
+                    count,
+                    dependency,
+                    endpoint,
+                )
+
+    def flush(self) -> None:
+        """Dumps histograms and gauges of the current process to "METRICS_DIR"
+
+        Returns:
+            None
+        """
+        if not self.enabled or not self._dir:
+            return
+        self._next_flush_at = time.monotonic() + self._flush_interval
+        snapshot = {'histograms': self._dump_histograms(), 'gauges': self._collect_gauges()}
+        path = os.path.join(self._dir, self._get_dump_filename())
+        try:
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(snapshot, file)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.warning('Failed to dump metrics to %s. Error: %s', path, e)
+
+    def retire_dump(self, pid: int) -> None:
+        """Adds histograms of an exited process to the "retired.json" dump and removes the process dump
+
+        Notes:
+            It is called by the gunicorn master for every exited worker, so the number of dumps
+            is bounded by the number of live workers, however often they are replaced.
+
+        Args:
+            pid (int): Process id of an exited process
+
+        Returns:
+            None
+        """
+        if not self.enabled or not self._dir:
+            return
+        prefix = f'{pid}-'
+        with self._lock_dumps(fcntl.LOCK_EX):
+            filenames = [filename for filename in os.listdir(self._dir) if filename.startswith(prefix)]
+            for filename in filenames:
+                # left by a process killed during a dump
+                if filename.endswith('.json.tmp'):
+                    os.remove(os.path.join(self._dir, filename))
+            filenames = [filename for filename in filenames if filename.endswith('.json')]
+            if not filenames:
+                return
+            retired_path = os.path.join(self._dir, self._RETIRED_DUMP)
+            merged: t.Dict[str, t.List[t.Any]] = {}
+            try:
+                for path in [retired_path] + [os.path.join(self._dir, filename) for filename in filenames]:
+                    if os.path.exists(path):
+                        with open(path) as file:
+                            self._add_histograms(merged, json.load(file)['histograms'])
+                with open(f'{retired_path}.tmp', 'w') as file:
+                    json.dump({'histograms': list(merged.values()), 'gauges': []}, file)
+                os.replace(f'{retired_path}.tmp', retired_path)
+                for filename in filenames:
+                    os.remove(os.path.join(self._dir, filename))
+            except (OSError, ValueError) as e:
+                logger.warning('Failed to retire metrics dumps of the process %s. Error: %s', pid, e)
+
+    def remove_dumps(self) -> None:
+        """Removes dumps of all processes from "METRICS_DIR", e.g. the ones left by a previous server run
+
+        Returns:
+            None
+        """
+        if not self._dir or not os.path.isdir(self._dir):
+            return
+        for filename in os.listdir(self._dir):
+            if not filename.endswith(('.json', '.json.tmp', '.lock')):
+                continue
+            try:
+                os.remove(os.path.join(self._dir, filename))
+            except OSError as e:
+                logger.warning('Failed to remove a metrics dump %s. Error: %s', filename, e)
+
+    def render(self) -> str:
+        """Renders metrics of all processes in the Prometheus text format
+
+        Returns:
+            str: Metrics
+        """
+        histograms = self._dump_histograms()
+        gauges = self._collect_gauges()
+        if self._dir:
+            histograms, gauges = self._merge_dumps(histograms, gauges)
+
+        lines = []
+        for name in (REQUEST_DURATION_METRIC, DEPENDENCY_DURATION_METRIC):
+            lines.append(f'# HELP {name} {_HELP[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for dumped_name, labels, bucket_counts, total, count in histograms:
+                if dumped_name != name:
+                    continue
+                cumulative_count = 0
+                for bucket, bucket_count in zip(self._buckets + ['+Inf'], bucket_counts):
+                    cumulative_count += bucket_count
+                    bucket_labels = self._format_labels(labels + [['le', str(bucket)]])
+                    lines.append(f'{name}_bucket{bucket_labels} {cumulative_count}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {total}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {count}')
+
+        for name in sorted({name for _, values in gauges for name in values}):
+            lines.append(f'# TYPE {name} gauge')
+            for pid, values in gauges:
+                if name in values:
+                    lines.append(f'{name}{self._format_labels([["pid", pid]])} {values[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def _reset_lock(self) -> None:
+        # the lock may be held by a thread of a parent process that does not exist in a child
+        self._lock = threading.Lock()
+
+    def _observe(self, key: _SeriesKey, duration: float) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._histograms = {}
+                self._pid = os.getpid()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self._buckets))
+            histogram.bucket_counts[bisect.bisect_left(self._buckets, duration)] += 1
+            histogram.sum += duration
+            histogram.count += 1
+
+    def _dump_histograms(self) -> t.List[t.List[t.Any]]:
+        with self._lock:
+            if self._pid != os.getpid():
+                return []
+            return [
+                [name, [list(label) for label in labels], list(histogram.bucket_counts), histogram.sum, histogram.count]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+
+    def _collect_gauges(self) -> t.List[t.List[t.Any]]:
+        values = {}
+        for group, collect in self._gauge_groups.items():
+            try:
+                for key, value in collect().items():
+                    values[f'auth_api_{group}_{key}'] = value
+            except Exception as e:
+                logger.warning('Failed to collect %s gauges. Error: %s', group, e)
+        return [[str(os.getpid()), values]]
+
+    def _merge_dumps(
+            self,
+            histograms: t.List[t.List[t.Any]],
+            gauges: t.List[t.List[t.Any]],
+    ) -> t.Tuple[t.List[t.List[t.Any]], t.List[t.List[t.Any]]]:
+        merged: t.Dict[str, t.List[t.Any]] = {json.dumps(h[:2]): h for h in histograms}
+        gauges_expire_at = time.time() - 3 * self._flush_interval
+        own_filename = self._get_dump_filename()
+        # a dump that is being retired is either in "retired.json" or in its own file, never in both
+        with self._lock_dumps(fcntl.LOCK_SH):
+            for filename in os.listdir(self._dir):
+                if not filename.endswith('.json') or filename == own_filename:
+                    continue
+                path = os.path.join(self._dir, filename)
+                try:
+                    with open(path) as file:
+                        snapshot = json.load(file)
+                    is_live = os.path.getmtime(path) >= gauges_expire_at
+                except (OSError, ValueError) as e:
+                    logger.warning('Failed to read metrics from %s. Error: %s', path, e)
+                    continue
+
+                self._add_histograms(merged, snapshot['histograms'])
+                if is_live:
+                    gauges.extend(snapshot['gauges'])
+        return list(merged.values()), gauges
+
+    def _get_dump_filename(self) -> str:
+        pid = os.getpid()
+        if self._dump_pid != pid:
+            # the start time tells a new process from an exited one with the same pid
+            self._dump_filename = f'{pid}-{time.time_ns()}.json'
+            self._dump_pid = pid
+        return self._dump_filename
+
+    @contextlib.contextmanager
+    def _lock_dumps(self, operation: int) -> t.Iterator[None]:
+        with open(os.path.join(self._dir, self._DUMPS_LOCK), 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _add_histograms(merged: t.Dict[str, t.List[t.Any]], histograms: t.List[t.List[t.Any]]) -> None:
+        for name, labels, bucket_counts, total, count in histograms:
+            key = json.dumps([name, labels])
+            if key not in merged:
+                merged[key] = [name, labels, [0] * len(bucket_counts), 0.0, 0]
+            histogram = merged[key]
+            histogram[2] = [a + b for a, b in zip(histogram[2], bucket_counts)]
+            histogram[3] += total
+            histogram[4] += count
+
+    @staticmethod
+    def _format_labels(labels: t.List[t.List[str]]) -> str:
+        escaped = (
+            (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in labels
+        )
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _get_metrics() -> Metrics:
+    # run is imported on the first call, so importing utils does not import and build the app
+    import run
+
+    return run.metrics
+
+
+def timed(dependency: str, operation: str) -> t.Callable:
+    """Creates a decorator that records a function latency as a dependency operation
+
+    Args:
+        dependency (str): Dependency name, e.g. "redis"
+        operation (str): Operation name
+
+    Returns:
+        callable: A decorator
+    """
+
+    def decorator(func: t.Callable) -> t.Callable:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> t.Any:
+            metrics = _get_metrics()
+            if not metrics.is_timing:
+                return func(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe_dependency(dependency, operation, time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+def start_request_timer() -> None:
+    """A "before_request" hook that starts a request latency timer
+
+    Returns:
+        None
+    """
+    g.metrics_request_started_at = time.perf_counter()
+    metrics = _get_metrics()
+    if metrics.server_timing_enabled:
+        # phase name -> [total duration, calls]
+        g.request_phases = {}
+    if metrics.is_counting_commands:
+        # dependency -> commands count
+        g.request_commands = {}
+
+
+def observe_request(response: Response) -> Response:
+    """An "after_request" hook that records a request latency and adds a "Server-Timing" header to trusted requests
+
+    Args:
+        response (Response): Response
+
+    Returns:
+        Response: The same response
+    """
+    started_at = g.pop('metrics_request_started_at', None)
+    if started_at is None:
+        return response
+    duration = time.perf_counter() - started_at
+    endpoint = request.endpoint or 'unmatched'
+    metrics = _get_metrics()
+    if metrics.enabled:
+        metrics.observe_request(endpoint, request.method, response.status_code, duration)
+
+    commands = g.pop('request_commands', None)
+    if commands:
+        metrics.check_request_commands(endpoint, commands)
+
+    phases = g.pop('request_phases', None)
+    if phases is not None:
+        if metrics.is_server_timing_trusted():
+            entries = [_format_server_timing(name, *phase) for name, phase in phases.items()]
+            entries.append(_format_server_timing('total', duration, 1))
+            response.headers['Server-Timing'] = ', '.join(entries)
+        logger.info(
+            'Request timings: endpoint=%s status=%s total=%.3fms %s',
+            endpoint,
+            response.status_code,
+            duration * 1000,
+            ' '.join(f'{name}={phase[0] * 1000:.3f}ms/{phase[1]}' for name, phase in phases.items()),
+        )
+    return response
+
+
+def _format_server_timing(name: str, duration: float, calls: int) -> str:
+    entry = f'{name};dur={duration * 1000:.3f}'
+    return f'{entry};desc="{calls} calls"' if calls > 1 else entry
+
+
+def instrument_sql_engine() -> None:
+    """Records latencies of all SQL statements by the statement type (SELECT, INSERT...)
+
+    Returns:
+        None
+    """
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_sql_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    duration = time.perf_counter() - conn.info['metrics_started_at'].pop()
+    metrics = _get_metrics()
+    metrics.observe_dependency('sql', statement.split(None, 1)[0].upper(), duration)
+    metrics.observe_command('sql', statement, parameters, duration)
+
+
+def _handle_sql_error(exception_context) -> None:
+    started_at = exception_context.connection.info.get('metrics_started_at') if exception_context.connection else None
+    if started_at:
+        started_at.pop()
+
+
+class InstrumentedRedis(Redis):
+    """A Redis client that reports every command to utils.Metrics"""
+
+    def execute_command(self, *args, **options) -> t.Any:
+        metrics = _get_metrics()
+        if not metrics.is_timing:
+            return super().execute_command(*args, **options)
+        started_at = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.observe_command('redis', args[0], args[1:], time.perf_counter() - started_at)
+
+    def pipeline(self, transaction: bool = True, shard_hint: t.Any = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(Pipeline):
+    """A Redis pipeline that reports every round trip to utils.Metrics as one "PIPELINE" command"""
+
+    def execute(self, raise_on_error: bool = True) -> t.List[t.Any]:
+        metrics = _get_metrics()
+        if not metrics.is_timing:
+            return super().execute(raise_on_error)
+        command = 'PIPELINE ' + ' '.join(str(args[0]) for args, _ in self.command_stack)
+        params = [args[1:] for args, _ in self.command_stack]
+        started_at = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.observe_command('redis', command, params, time.perf_counter() - started_at)
+
+
+def _redact(params: t.Any) -> t.Any:
+    # keeps a structure and value types only, values may be tokens, emails or password hashes
+    if isinstance(params, dict):
+        return {key: _redact(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_redact(value) for value in params]
+    if params is None:
+        return None
+    return f'<{type(params).__name__}>'
@@ -0,0 +1,183 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import log
+from src.password_hashing import (
+    PasswordHashMethods,
+    argon2_needs_rehash,
+    check_password_hash,
+    create_argon2_hasher,
+    generate_password_hash,
+)
+from .context_managers import ProcessConnectionPool
+from .limiters import ConcurrencyLimiter
+from .metrics import timed
+
+logger = log.APILogger(__name__)
+
+
+class PasswordHasher:
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Runs password hashing and verification in a bounded process pool.
+
+        Notes:
+            PBKDF2 is pure CPU work that holds the GIL, so it is moved out of request workers.
+            The pool has "PASSWORD_HASHING_WORKERS" processes (all cores by default, 0 hashes inline).
+            Every operation goes through a ConcurrencyLimiter: at most "PASSWORD_HASHING_MAX_PENDING"
+            operations of a worker run at once, "PASSWORD_HASHING_QUEUE_SIZE" callers may wait for
+            "PASSWORD_HASHING_QUEUE_TIMEOUT" seconds and the others get CapacityExceededError at once.
+            "PASSWORD_HASHING_GLOBAL_LIMIT" caps running operations of all workers via Redis.
+            The pool is created lazily and re-created after a fork. Its processes are spawned,
+            so they do not inherit sockets, locks or threads of a worker.
+
+            New hashes use "PASSWORD_HASH_METHOD" with its cost parameters, hashes of other methods
+            or with other parameters are still verified and reported by "needs_rehash".
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._method: PasswordHashMethods = PasswordHashMethods(self._app_config['PASSWORD_HASH_METHOD'])
+        self._params: t.Dict[str, int] = self.get_params(self._app_config, self._method)
+        if self._method is PasswordHashMethods.ARGON2:
+            # fail fast if argon2-cffi is not installed
+            create_argon2_hasher(self._params)
+        self._workers: int = self._app_config['PASSWORD_HASHING_WORKERS']
+        global_limit = self._app_config['PASSWORD_HASHING_GLOBAL_LIMIT']
+        self._limiter: ConcurrencyLimiter = ConcurrencyLimiter(
+            'passwordHashing',
+            max_concurrency=self._app_config['PASSWORD_HASHING_MAX_PENDING'],
+            max_waiting=self._app_config['PASSWORD_HASHING_QUEUE_SIZE'],
+            wait_timeout=self._app_config['PASSWORD_HASHING_QUEUE_TIMEOUT'],
+            retry_after=self._app_config['PASSWORD_HASHING_RETRY_AFTER'],
+            global_limit=global_limit,
+            connection_pool=(
+                ProcessConnectionPool.from_config(self._app_config, self._app_config['REDIS_JWT_DB'])
+                if global_limit else None
+            ),
+        )
+        self._executor: t.Optional[ProcessPoolExecutor] = None
+        self._executor_pid: t.Optional[int] = None
+        self._executor_lock: threading.Lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def get_params(config: t.Dict[str, t.Any], method: PasswordHashMethods) -> t.Dict[str, int]:
+        """Gets cost parameters of a password hash method from the app config
+
+        Args:
+            config (dict): app config
+            method (PasswordHashMethods): Password hash method
+
+        Returns:
+            dict: Cost parameters
+        """
+        if method is PasswordHashMethods.PBKDF2:
+            return {'iterations': config['PASSWORD_PBKDF2_ITERATIONS']}
+        if method is PasswordHashMethods.SCRYPT:
+            return {'n': config['PASSWORD_SCRYPT_N'], 'r': config['PASSWORD_SCRYPT_R'], 'p': config['PASSWORD_SCRYPT_P']}
+        return {
+            'time_cost': config['PASSWORD_ARGON2_TIME_COST'],
+            'memory_cost': config['PASSWORD_ARGON2_MEMORY_COST'],
+            'parallelism': config['PASSWORD_ARGON2_PARALLELISM'],
+        }
+
+    @timed('password_hashing', 'hash')
+    def generate_password_hash(self, password: str) -> str:
+        """Hashes a password
+
+        Args:
+            password (str): Password
+
+        Returns:
+            str: Password hash
+
+        Raises:
+            CapacityExceededError: if the hashing capacity is exhausted
+        """
+        return self._run(generate_password_hash, password, self._method.value, self._params)
+
+    @timed('password_hashing', 'check')
+    def check_password_hash(self, password_hash: str, password: str) -> bool:
+        """Checks a password against a password hash
+
+        Args:
+            password_hash (str): Password hash
+            password (str): Password
+
+        Returns:
+            bool: True if the password matches the hash
+
+        Raises:
+            CapacityExceededError: if the hashing capacity is exhausted
+        """
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Checks if a password hash was made by another method or with other cost parameters
+
+        Args:
+            password_hash (str): Password hash
+
+        Returns:
+            bool: True if the password should be hashed again
+        """
+        if self._method is PasswordHashMethods.PBKDF2:
+            return not password_hash.startswith(f'pbkdf2:sha256:{self._params["iterations"]}$')
+        if self._method is PasswordHashMethods.SCRYPT:
+            params = self._params
+            return not password_hash.startswith(f'scrypt:{params["n"]}:{params["r"]}:{params["p"]}$')
+        if not password_hash.startswith('$argon2'):
+            return True
+        return argon2_needs_rehash(password_hash, self._params)
+
+    def shutdown(self) -> None:
+        """Stops pool processes of the current process
+
+        Returns:
+            None
+        """
+        with self._executor_lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._executor_pid = None
+
+    def _run(self, func: t.Callable, *args: t.Any) -> t.Any:
+        with self._limiter.acquire():
+            if not self._workers:
+                return func(*args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool as e:
+                # a pool process was killed (e.g. by the OOM killer), the pool can not be used anymore
+                logger.warning('Password hashing pool is broken, restarting it. Error: %s', e)
+                self._discard_executor(executor)
+                return self._get_executor().submit(func, *args).result()
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._executor_lock:
+            # another thread may have replaced the broken pool already
+            if self._executor is executor:
+                executor.shutdown(wait=False)
+                self._executor = None
+                self._executor_pid = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != pid:
+                    logger.info('Starting a password hashing pool with %s processes...', self._workers)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self._workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                    self._executor_pid = pid
+        return self._executor
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+import log
+from .context_managers import ProcessConnectionPool, RedisContextManager
+
+logger = log.APILogger(__name__)
+
+
+class UserPrincipal(t.NamedTuple):
+    """A lightweight, session independent snapshot of an authenticated user"""
+    id: str
+    username: str
+    email_address: str
+    is_active: int
+    # a UNIX timestamp of the last password change
+    password_epoch: int = 0
+
+    @classmethod
+    def from_user(cls, user: t.Any) -> UserPrincipal:
+        """Creates a principal from a User model object
+
+        Args:
+            user (User): User object
+
+        Returns:
+            UserPrincipal: user principal
+        """
+        return cls(user.id, user.username, user.email_address, user.is_active, user.password_epoch)
+
+    @classmethod
+    def from_claims(cls, claims: t.Dict[str, t.Any]) -> t.Optional[UserPrincipal]:
+        """Creates a principal from access token claims
+
+        Args:
+            claims (dict): decoded access token
+
+        Returns:
+            UserPrincipal (optional): user principal if the token has all principal claims, None otherwise
+        """
+        try:
+            return cls(claims['rid'], claims['usr'], claims['eml'], claims['act'], claims['pwe'])
+        except KeyError:
+            return None
+
+    def to_claims(self) -> t.Dict[str, t.Any]:
+        """Creates access token claims
+
+        Returns:
+            dict: claims that can be turned back to a principal by "from_claims"
+        """
+        return {
+            'rid': self.id,
+            'usr': self.username,
+            'eml': self.email_address,
+            'act': self.is_active,
+            'pwe': self.password_epoch,
+        }
+
+    def __repr__(self) -> str:
+        return f'<User {self.username}, {self.email_address}>'
+
+
+class UserPrincipalCache:
+    _KEY_PREFIX: str = 'userPrincipal:'
+    _STATE_KEY_PREFIX: str = 'userPrincipalState:'
+
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Two-tier TTL cache of user principals.
+
+        Notes:
+            The in-process tier keeps principals for "USER_PRINCIPAL_CACHE_LOCAL_TTL" seconds,
+            the optional Redis tier ("USER_PRINCIPAL_CACHE_REDIS") is shared by all workers and keeps them
+            for "USER_PRINCIPAL_CACHE_TTL" seconds. A zero "USER_PRINCIPAL_CACHE_TTL" disables the cache.
+            "invalidate" clears both tiers of the current worker, other workers may serve a stale
+            principal from their in-process tier until it expires.
+            "refresh" also keeps the password epoch and the active flag of a user (its state), even if
+            the cache is disabled, so "is_stale" detects access token claims issued before a change.
+            A state is kept in-process for "USER_PRINCIPAL_CACHE_LOCAL_TTL" seconds and, with
+            "USER_PRINCIPAL_CACHE_REDIS", in Redis for "JWT_ACCESS_TOKEN_EXPIRATION" seconds,
+            so other workers detect a change after up to "USER_PRINCIPAL_CACHE_LOCAL_TTL" seconds.
+            Without Redis a state is kept in-process for "JWT_ACCESS_TOKEN_EXPIRATION" seconds and other
+            workers trust the claims, so a change revokes their access tokens only when the tokens expire.
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._ttl: int = self._app_config['USER_PRINCIPAL_CACHE_TTL']
+        self._local_ttl: int = min(self._app_config['USER_PRINCIPAL_CACHE_LOCAL_TTL'], self._ttl)
+        self._local_max_size: int = self._app_config['USER_PRINCIPAL_CACHE_SIZE']
+        # user id -> (principal, expiration time)
+        self._local_cache: t.OrderedDict[str, t.Tuple[UserPrincipal, float]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        self._state_ttl: int = max(self._app_config['JWT_ACCESS_TOKEN_EXPIRATION'], 1)
+        self._connection_pool: t.Optional[ProcessConnectionPool] = None
+        if self._app_config['USER_PRINCIPAL_CACHE_REDIS']:
+            self._connection_pool = ProcessConnectionPool.from_config(
+                self._app_config,
+                self._app_config['REDIS_JWT_DB'],
+            )
+        self._local_state_ttl: int = (
+            self._app_config['USER_PRINCIPAL_CACHE_LOCAL_TTL'] if self._connection_pool else self._state_ttl
+        )
+        # user id -> (password epoch and active flag, empty if they were not changed recently, expiration time)
+        self._local_states: t.OrderedDict[str, t.Tuple[t.Tuple[int, ...], float]] = OrderedDict()
+
+    def get_or_load(self, user_id: str, loader: t.Callable[[], t.Any]) -> t.Optional[UserPrincipal]:
+        """Gets a user principal from the cache or loads it with a loader and caches it
+
+        Args:
+            user_id (str): User id
+            loader (callable): Returns a User object or None if such user does not exist
+
+        Returns:
+            UserPrincipal (optional): User principal if such user exists, None otherwise
+        """
+        if not self._ttl:
+            user = loader()
+            return UserPrincipal.from_user(user) if user else None
+
+        principal = self._get_local(user_id)
+        if principal:
+            return principal
+
+        if self._connection_pool:
+            principal = self._get_shared(user_id)
+            if principal:
+                self._set_local(principal)
+                return principal
+
+        user = loader()
+        if not user:
+            return None
+        principal = UserPrincipal.from_user(user)
+        self._set_local(principal)
+        if self._connection_pool:
+            self._set_shared(principal)
+        return principal
+
+    def invalidate(self, user_id: str) -> None:
+        """Removes a user principal from the cache
+
+        Args:
+            user_id (str): User id
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._local_cache.pop(user_id, None)
+        if self._connection_pool:
+            try:
+                with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                    redis_conn.delete(self._KEY_PREFIX + user_id)
+            except Exception as e:
+                logger.error(f'Failed to remove a user principal with id: {user_id} from Redis. Error: {e}')
+
+    def refresh(self, principal: UserPrincipal) -> None:
+        """Replaces a cached user principal by a new one
+
+        Notes:
+            Unlike "invalidate" the current worker keeps the new principal and the Redis tier keeps
+            its password epoch and active flag, so "is_stale" can detect access tokens issued before the change.
+
+        Args:
+            principal (UserPrincipal): User principal
+
+        Returns:
+            None
+        """
+        state = (principal.password_epoch, principal.is_active)
+        self._set_local_state(principal.id, state)
+        if self._connection_pool:
+            self._set_shared_state(principal.id, state)
+        if not self._ttl:
+            return
+        self._set_local(principal)
+        if self._connection_pool:
+            self._set_shared(principal)
+
+    def is_stale(self, principal: UserPrincipal) -> bool:
+        """Checks a principal (e.g. made from token claims) against the in-process tier and the user state
+
+        Notes:
+            A user state is read from Redis only if the in-process one expired, so most calls do not leave
+            the process. If Redis fails, the principal is stale and has to be loaded by "get_or_load".
+
+        Args:
+            principal (UserPrincipal): User principal
+
+        Returns:
+            bool: True if the principal may differ from the current one of the same user
+        """
+        if self._ttl:
+            cached = self._get_local(principal.id)
+            if cached is not None and cached != principal:
+                return True
+        state = self._get_local_state(principal.id)
+        if state is None:
+            if not self._connection_pool:
+                return False
+            try:
+                state = self._get_shared_state(principal.id)
+            except Exception as e:
+                logger.warning('Failed to get a user principal state from Redis. Error: %s', e)
+                return True
+            self._set_local_state(principal.id, state)
+        return bool(state) and state != (principal.password_epoch, principal.is_active)
+
+    def reset_connection_pool(self) -> None:
+        """Drops the Redis tier connection pool, so a new one is created on the next call
+
+        Returns:
+            None
+        """
+        if self._connection_pool:
+            self._connection_pool.reset()
+
+    def warm_up_connection_pool(self, connections: int) -> None:
+        """Opens connections of the Redis tier pool in advance
+
+        Args:
+            connections (int): Number of connections
+
+        Returns:
+            None
+        """
+        if self._connection_pool:
+            self._connection_pool.warm_up(connections)
+
+    def _get_local(self, user_id: str) -> t.Optional[UserPrincipal]:
+        with self._lock:
+            cached = self._local_cache.get(user_id)
+            if not cached:
+                return None
+            principal, expires_at = cached
+            if expires_at <= time.monotonic():
+                del self._local_cache[user_id]
+                return None
+            self._local_cache.move_to_end(user_id)
+            return principal
+
+    def _set_local(self, principal: UserPrincipal) -> None:
+        with self._lock:
+            self._local_cache[principal.id] = (principal, time.monotonic() + self._local_ttl)
+            self._local_cache.move_to_end(principal.id)
+            while len(self._local_cache) > self._local_max_size:
+                self._local_cache.popitem(last=False)
+
+    def _get_shared(self, user_id: str) -> t.Optional[UserPrincipal]:
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                cached = redis_conn.get(self._KEY_PREFIX + user_id)
+        except Exception as e:
+            logger.warning('Failed to get a user principal from Redis. Error: %s', e)
+            return None
+        return UserPrincipal(*json.loads(cached)) if cached else None
+
+    def _get_local_state(self, user_id: str) -> t.Optional[t.Tuple[int, ...]]:
+        with self._lock:
+            cached = self._local_states.get(user_id)
+            if not cached:
+                return None
+            state, expires_at = cached
+            if expires_at <= time.monotonic():
+                del self._local_states[user_id]
+                return None
+            return state
+
+    def _set_local_state(self, user_id: str, state: t.Tuple[int, ...]) -> None:
+        with self._lock:
+            self._local_states[user_id] = (state, time.monotonic() + self._local_state_ttl)
+            self._local_states.move_to_end(user_id)
+            while len(self._local_states) > self._local_max_size:
+                self._local_states.popitem(last=False)
+
+    def _get_shared_state(self, user_id: str) -> t.Tuple[int, ...]:
+        with RedisContextManager(self._connection_pool.get()) as redis_conn:
+            state = redis_conn.get(self._STATE_KEY_PREFIX + user_id)
+        return tuple(json.loads(state)) if state else ()
+
+    def _set_shared_state(self, user_id: str, state: t.Tuple[int, ...]) -> None:
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                redis_conn.set(self._STATE_KEY_PREFIX + user_id, json.dumps(state), ex=self._state_ttl)
+        except Exception as e:
+            logger.warning('Failed to put a user principal state into Redis. Error: %s', e)
+
+    def _set_shared(self, principal: UserPrincipal) -> None:
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                redis_conn.set(self._KEY_PREFIX + principal.id, json.dumps(principal), ex=self._ttl)
+        except Exception as e:
+            logger.warning('Failed to put a user principal into Redis. Error: %s', e)
@@ -0,0 +1,148 @@
+import atexit
+import collections
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import typing as t
+
+from flask import request
+
+import log
+
+logger = log.APILogger(__name__)
+
+COLLAPSED_STACKS_EXTENSION: str = '.collapsed'
+
+
+class SamplingProfiler:
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Statistical profiler of requests that samples stacks of request threads.
+
+        Notes:
+            A "PROFILER_SAMPLE_RATE" fraction of requests is profiled, and requests with a "PROFILER_HEADER"
+            header equal to "PROFILER_TOKEN" (if it is set). One background thread of a process takes
+            a stack of every profiled request thread each "PROFILER_INTERVAL_MS" milliseconds,
+            so the overhead does not depend on a call count like the one of cProfile.
+            Stacks are aggregated per endpoint and dumped every "PROFILER_FLUSH_INTERVAL" seconds
+            (and at exit) to "<PROFILER_DIR>/<endpoint>.<pid>.collapsed" in the collapsed stack format
+            of flamegraph.pl, "flask profiles summarize" merges the dumps of all processes.
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._sample_rate: float = self._app_config['PROFILER_SAMPLE_RATE']
+        self._header: str = self._app_config['PROFILER_HEADER']
+        self._token: str = self._app_config['PROFILER_TOKEN']
+        self.enabled: bool = bool(self._sample_rate or self._token)
+        self._dir: str = self._app_config['PROFILER_DIR']
+        self._interval: float = self._app_config['PROFILER_INTERVAL_MS'] / 1000
+        self._flush_interval: float = self._app_config['PROFILER_FLUSH_INTERVAL']
+        # thread id -> stacks of a running profiled request
+        self._active: t.Dict[int, t.Counter[str]] = {}
+        # endpoint -> stacks of finished requests
+        self._stacks: t.Dict[str, t.Counter[str]] = collections.defaultdict(collections.Counter)
+        self._frame_labels: t.Dict[t.Any, str] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._sampler: t.Optional[threading.Thread] = None
+        self._sampler_pid: t.Optional[int] = None
+        if self.enabled:
+            os.makedirs(self._dir, exist_ok=True)
+            atexit.register(self.flush)
+
+    def start_request(self) -> None:
+        """A "before_request" hook that starts profiling of a sampled request
+
+        Returns:
+            None
+        """
+        if not self._is_sampled():
+            return
+        if self._sampler_pid != os.getpid():
+            self._start_sampler()
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+
+    def stop_request(self, exc: t.Optional[BaseException] = None) -> None:
+        """A "teardown_request" hook that stops profiling of a request
+
+        Args:
+            exc (Exception, optional): Unhandled exception
+
+        Returns:
+            None
+        """
+        if not self._active:
+            return
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+            if stacks:
+                self._stacks[request.endpoint or 'unmatched'].update(stacks)
+
+    def flush(self) -> None:
+        """Dumps stacks of finished requests of the current process to "PROFILER_DIR"
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._sampler_pid != os.getpid():
+                return
+            dumps = {endpoint: stacks.copy() for endpoint, stacks in self._stacks.items()}
+        for endpoint, stacks in dumps.items():
+            path = os.path.join(self._dir, f'{endpoint}.{os.getpid()}{COLLAPSED_STACKS_EXTENSION}')
+            try:
+                with open(f'{path}.tmp', 'w') as file:
+                    file.writelines(f'{stack} {count}\n' for stack, count in stacks.items())
+                os.replace(f'{path}.tmp', path)
+            except OSError as e:
+                logger.warning('Failed to dump profiles to %s. Error: %s', path, e)
+
+    def _is_sampled(self) -> bool:
+        if self._token:
+            token = request.headers.get(self._header)
+            if token and hmac.compare_digest(token, self._token):
+                return True
+        return self._sample_rate > 0 and random.random() < self._sample_rate
+
+    def _start_sampler(self) -> None:
+        with self._lock:
+            pid = os.getpid()
+            if self._sampler_pid == pid:
+                return
+            # stacks inherited from a parent process were dumped by the parent
+            self._active = {}
+            self._stacks.clear()
+            self._sampler = threading.Thread(target=self._sample, name='RequestProfiler', daemon=True)
+            self._sampler.start()
+            self._sampler_pid = pid
+
+    def _sample(self) -> None:
+        next_flush_at = time.monotonic() + self._flush_interval
+        while True:
+            time.sleep(self._interval)
+            if self._active:
+                frames = sys._current_frames()
+                with self._lock:
+                    for thread_id, stacks in self._active.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            stacks[self._collapse(frame)] += 1
+            if time.monotonic() >= next_flush_at:
+                self.flush()
+                next_flush_at = time.monotonic() + self._flush_interval
+
+    def _collapse(self, frame: t.Any) -> str:
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._frame_labels.get(code)
+            if label is None:
+                module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+                label = self._frame_labels[code] = f'{module}:{code.co_name}:{code.co_firstlineno}'
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
@@ -0,0 +1,290 @@
+import collections
+import threading
+import time
+import typing as t
+import uuid
+from enum import Enum, unique
+
+from flask import Request
+from redis.commands.core import Script
+
+import log
+from src.abstractions.abc_rate_limiter_backend import ABCRateLimiterBackend
+from .context_managers import ProcessConnectionPool, RedisContextManager, create_script
+
+logger = log.APILogger(__name__)
+
+
+@unique
+class RateLimiterBackends(Enum):
+    REDIS = 'redis'
+    # a single-process backend, limits are not shared between workers
+    MEMORY = 'memory'
+
+
+class RedisSlidingWindowBackend(ABCRateLimiterBackend):
+    _KEY_PREFIX: str = 'rateLimit:'
+
+    # KEYS: hits sorted set. ARGV: now (ms), window (ms), limit, hit id
+    _HIT_SCRIPT: str = """
+        local now = tonumber(ARGV[1])
+        local window = tonumber(ARGV[2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+            local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+            return math.max(1, tonumber(oldest[2]) + window - now)
+        end
+        redis.call('ZADD', KEYS[1], now, ARGV[4])
+        redis.call('PEXPIRE', KEYS[1], window)
+        return 0
+    """
+
+    # KEYS: hits sorted set. ARGV: now (ms), window (ms), limit
+    _PEEK_SCRIPT: str = """
+        local now = tonumber(ARGV[1])
+        local window = tonumber(ARGV[2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+            local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+            return math.max(1, tonumber(oldest[2]) + window - now)
+        end
+        return 0
+    """
+
+    def __init__(self, connection_pool: ProcessConnectionPool) -> None:
+        """Sliding window (log) rate limiter backend, every check is one atomic script call
+
+        Args:
+            connection_pool (ProcessConnectionPool): Redis connection pool
+        """
+        self._connection_pool: ProcessConnectionPool = connection_pool
+        self._hit_script: Script = create_script(self._HIT_SCRIPT)
+        self._peek_script: Script = create_script(self._PEEK_SCRIPT)
+
+    def hit(self, key: str, limit: int, window: int) -> int:
+        """Registers a hit if it fits the limit
+
+        Args:
+            key (str): Rate limit key
+            limit (int): Max number of hits in a window
+            window (int): Window size in seconds
+
+        Returns:
+            int: 0 if the hit is allowed, otherwise milliseconds until the next hit is allowed
+        """
+        with RedisContextManager(self._connection_pool.get()) as redis_conn:
+            return self._hit_script(
+                keys=[self._KEY_PREFIX + key],
+                args=[int(time.time() * 1000), window * 1000, limit, uuid.uuid4().hex],
+                client=redis_conn,
+            )
+
+    def peek(self, key: str, limit: int, window: int) -> int:
+        """Checks if a hit fits the limit without registering it
+
+        Args:
+            key (str): Rate limit key
+            limit (int): Max number of hits in a window
+            window (int): Window size in seconds
+
+        Returns:
+            int: 0 if a hit is allowed, otherwise milliseconds until the next hit is allowed
+        """
+        with RedisContextManager(self._connection_pool.get()) as redis_conn:
+            return self._peek_script(
+                keys=[self._KEY_PREFIX + key],
+                args=[int(time.time() * 1000), window * 1000, limit],
+                client=redis_conn,
+            )
+
+
+class InMemorySlidingWindowBackend(ABCRateLimiterBackend):
+    _SWEEP_INTERVAL: float = 60.0
+
+    def __init__(self) -> None:
+        """Thread-safe sliding window (log) rate limiter backend that lives in the memory of the current process"""
+        # key -> hit times
+        self._hits: t.Dict[str, t.Deque[float]] = collections.defaultdict(collections.deque)
+        self._lock: threading.Lock = threading.Lock()
+        self._last_sweep_at: float = time.monotonic()
+        self._max_window: int = 0
+
+    def hit(self, key: str, limit: int, window: int) -> int:
+        """Registers a hit if it fits the limit
+
+        Args:
+            key (str): Rate limit key
+            limit (int): Max number of hits in a window
+            window (int): Window size in seconds
+
+        Returns:
+            int: 0 if the hit is allowed, otherwise milliseconds until the next hit is allowed
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._max_window = max(self._max_window, window)
+            self._sweep(now)
+            hits = self._hits[key]
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return max(1, int((hits[0] + window - now) * 1000))
+            hits.append(now)
+            return 0
+
+    def peek(self, key: str, limit: int, window: int) -> int:
+        """Checks if a hit fits the limit without registering it
+
+        Args:
+            key (str): Rate limit key
+            limit (int): Max number of hits in a window
+            window (int): Window size in seconds
+
+        Returns:
+            int: 0 if a hit is allowed, otherwise milliseconds until the next hit is allowed
+        """
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return max(1, int((hits[0] + window - now) * 1000))
+            return 0
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep_at < self._SWEEP_INTERVAL:
+            return
+        self._last_sweep_at = now
+        stale_keys = [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - self._max_window]
+        for key in stale_keys:
+            del self._hits[key]
+
+
+class RateLimiter:
+    _CONFIG_PREFIX: str = 'RATE_LIMIT_'
+
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Checks named rate limits that are set by "RATE_LIMIT_<NAME>" config values.
+
+        Notes:
+            A limit value is "<hits>/<seconds>", e.g. "5/60". An empty value disables the limit.
+            The backend is set by "RATE_LIMITER_BACKEND". If Redis is unavailable, requests are allowed.
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._backend: ABCRateLimiterBackend = InMemorySlidingWindowBackend()
+        if RateLimiterBackends(self._app_config['RATE_LIMITER_BACKEND']) is RateLimiterBackends.REDIS:
+            self._backend = RedisSlidingWindowBackend(
+                ProcessConnectionPool.from_config(self._app_config, self._app_config['REDIS_JWT_DB'])
+            )
+        self._limits: t.Dict[str, t.Optional[t.Tuple[int, int]]] = {}
+
+    def check(self, name: str, key: t.Optional[str]) -> int:
+        """Registers a hit of a named rate limit
+
+        Args:
+            name (str): Limit name, e.g. "LOGIN_IP" for the "RATE_LIMIT_LOGIN_IP" config value
+            key (str, optional): Rate limited entity, e.g. IP address. None skips the check
+
+        Returns:
+            int: 0 if the hit is allowed, otherwise seconds until the next hit is allowed
+        """
+        return self._call_backend(self._backend.hit, name, key)
+
+    def peek(self, name: str, key: t.Optional[str]) -> int:
+        """Checks a named rate limit without registering a hit
+
+        Args:
+            name (str): Limit name, e.g. "LOGIN_USERNAME" for the "RATE_LIMIT_LOGIN_USERNAME" config value
+            key (str, optional): Rate limited entity, e.g. username. None skips the check
+
+        Returns:
+            int: 0 if a hit is allowed, otherwise seconds until the next hit is allowed
+        """
+        return self._call_backend(self._backend.peek, name, key)
+
+    def _call_backend(self, method: t.Callable[[str, int, int], int], name: str, key: t.Optional[str]) -> int:
+        limit = self._get_limit(name)
+        if not limit or not key:
+            return 0
+        hits, window = limit
+        try:
+            retry_after_ms = method(f'{name}:{key}', hits, window)
+        except Exception as e:
+            logger.warning('Failed to check the rate limit %s, the request is allowed. Error: %s', name, e)
+            return 0
+        return -(-retry_after_ms // 1000)
+
+    def _get_limit(self, name: str) -> t.Optional[t.Tuple[int, int]]:
+        if name not in self._limits:
+            value = self._app_config.get(self._CONFIG_PREFIX + name)
+            if value:
+                hits, window = value.split('/')
+                self._limits[name] = (int(hits), int(window))
+            else:
+                self._limits[name] = None
+        return self._limits[name]
+
+
+def get_client_ip(request_obj: Request) -> t.Optional[str]:
+    """Gets a rate limit key by a client IP address
+
+    Notes:
+        Behind a reverse proxy it is the proxy IP unless "PROXY_FIX_X_FOR" is set.
+
+    Args:
+        request_obj (Request): request object
+
+    Returns:
+        str (optional): Client IP address
+    """
+    return request_obj.remote_addr
+
+
+def get_auth_username(request_obj: Request) -> t.Optional[str]:
+    """Gets a rate limit key by a Basic auth username
+
+    Args:
+        request_obj (Request): request object
+
+    Returns:
+        str (optional): Username in lower case
+    """
+    auth = request_obj.authorization
+    return auth.username.lower() if auth and auth.username else None
+
+
+def get_auth_username_and_client_ip(request_obj: Request) -> t.Optional[str]:
+    """Gets a rate limit key by a Basic auth username and a client IP address
+
+    Notes:
+        Failed logins of one client do not lock out the same username on other clients.
+
+    Args:
+        request_obj (Request): request object
+
+    Returns:
+        str (optional): Username in lower case and client IP address
+    """
+    username = get_auth_username(request_obj)
+    client_ip = get_client_ip(request_obj)
+    return f'{username}:{client_ip}' if username and client_ip else None
+
+
+def get_body_email_address(request_obj: Request) -> t.Optional[str]:
+    """Gets a rate limit key by an "emailAddress" field of a JSON request body
+
+    Args:
+        request_obj (Request): request object
+
+    Returns:
+        str (optional): Email address in lower case
+    """
+    body = request_obj.get_json(silent=True)
+    email_address = body.get('emailAddress') if isinstance(body, dict) else None
+    return email_address.lower() if isinstance(email_address, str) else None
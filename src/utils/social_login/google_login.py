@@ -4,8 +4,6 @@ from pathlib import Path
 
 from requests import Response
 
-import run
-
 
 class GoogleLoginUtil:
     def __init__(self, config: t.Dict[str, t.Any]) -> None:
@@ -17,6 +15,7 @@ class GoogleLoginUtil:
         Args:
             config (dict): app config
         """
+        import run
 
         self._google = run.oauth.register(**config)
 
@@ -55,6 +54,8 @@ def create_google_config(base_dir: Path, filename: str) -> t.Dict[str, t.Any]:
     Returns:
         dict: Dict with OAuth config for Google auth
     """
+    import run
+
     google_auth_config = get_config_from_json(base_dir, filename)
     google_auth_config.update({
         'client_id': run.auth_api.config['GOOGLE_CLIENT_ID'],
@@ -1,24 +1,241 @@
+import hashlib
+import threading
+import time
 import typing as t
+from enum import Enum, unique
 
-from .context_managers import RedisContextManager
+from redis import ConnectionPool
+from redis.commands.core import Script
 
+import log
+from src.abstractions.abc_token_storage import ABCTokenStorage
+from .context_managers import ProcessConnectionPool, RedisContextManager, create_script
+from .metrics import timed
 
-class RefreshTokenStorageController:
-    _KEY_NAME: str = 'refreshTokens'
+logger = log.APILogger(__name__)
 
-    def __init__(self, host: str, port: int, db: int, password: str = '') -> None:
+# a clock of InMemoryRefreshTokenStorageController, tests replace it
+_monotonic: t.Callable[[], float] = time.monotonic
+
+
+@unique
+class TokenStorageModes(Enum):
+    # a session key contains a full refresh token
+    PLAIN = 'plain'
+    # a session key contains a fixed-size binary digest of a refresh token
+    DIGEST = 'digest'
+
+
+@unique
+class TokenStorageBackends(Enum):
+    REDIS = 'redis'
+    # a single-process storage, sessions are lost on restart and are not shared between workers
+    MEMORY = 'memory'
+
+
+@unique
+class ResetPasswordEmailStatuses(Enum):
+    # a request is being processed
+    PENDING = 'pending'
+    SENT = 'sent'
+    # no user has such email address
+    NOT_FOUND = 'notFound'
+
+
+class RefreshTokenStorageController(ABCTokenStorage):
+    _TOKEN_KEY_PREFIX: str = 'refreshToken:'
+    _DIGEST_TOKEN_KEY_PREFIX: bytes = b'refreshTokenDigest:'
+    _USER_KEY_PREFIX: str = 'userRefreshToken:'
+    _TOKEN_DIGEST_SIZE: int = 16
+    # a layout used before sessions got a TTL: two hashes that never expire
+    _LEGACY_KEY_NAME: str = 'refreshTokens'
+    _LEGACY_USER_INDEX_KEY_NAME: str = 'userRefreshTokens'
+    _COMPACTION_BATCH_SIZE: int = 1000
+
+    # KEYS: new token key, user key, legacy hash, legacy user index.
+    # ARGV: user id, new token reference, TTL, token key prefix, plain token key prefix.
+    # A user key of a session stored before the "digest" storage mode was turned on holds a plain token,
+    # so both candidate token keys are removed.
+    _ISSUE_SCRIPT: str = """
+        local current_token = redis.call('GET', KEYS[2])
+        if current_token then
+            redis.call('DEL', ARGV[4] .. current_token, ARGV[5] .. current_token)
+        else
+            local legacy_token = redis.call('HGET', KEYS[4], ARGV[1])
+            if legacy_token then
+                redis.call('HDEL', KEYS[3], legacy_token)
+                redis.call('HDEL', KEYS[4], ARGV[1])
+            end
+        end
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+        redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+        return 1
+    """
+    # KEYS: current token key, new token key, legacy hash, legacy user index, current plain token key.
+    # ARGV: current refresh token, new token reference, TTL, user key prefix
+    _ROTATE_SCRIPT: str = """
+        local user_id = redis.call('GET', KEYS[1])
+        if user_id then
+            redis.call('DEL', KEYS[1])
+        elseif KEYS[5] ~= KEYS[1] then
+            user_id = redis.call('GET', KEYS[5])
+            if user_id then
+                redis.call('DEL', KEYS[5])
+            end
+        end
+        if not user_id then
+            user_id = redis.call('HGET', KEYS[3], ARGV[1])
+            if not user_id then
+                return false
+            end
+            redis.call('HDEL', KEYS[3], ARGV[1])
+            redis.call('HDEL', KEYS[4], user_id)
+        end
+        redis.call('SET', KEYS[2], user_id, 'EX', ARGV[3])
+        redis.call('SET', ARGV[4] .. user_id, ARGV[2], 'EX', ARGV[3])
+        return user_id
+    """
+    # KEYS: user key, legacy hash, legacy user index. ARGV: user id, token key prefix, plain token key prefix
+    _REVOKE_SCRIPT: str = """
+        local current_token = redis.call('GET', KEYS[1])
+        if current_token then
+            redis.call('DEL', ARGV[2] .. current_token, ARGV[3] .. current_token, KEYS[1])
+        end
+        local legacy_token = redis.call('HGET', KEYS[3], ARGV[1])
+        if legacy_token then
+            redis.call('HDEL', KEYS[2], legacy_token)
+            redis.call('HDEL', KEYS[3], ARGV[1])
+        end
+        return 1
+    """
+    # KEYS: token key, user key, legacy hash, legacy user index. ARGV: refresh token, user id, TTL, token reference
+    # A legacy session is dropped if the user already has a session in the new layout.
+    _MIGRATE_LEGACY_SCRIPT: str = """
+        redis.call('HDEL', KEYS[3], ARGV[1])
+        if redis.call('HGET', KEYS[4], ARGV[2]) == ARGV[1] then
+            redis.call('HDEL', KEYS[4], ARGV[2])
+        end
+        if redis.call('EXISTS', KEYS[2]) == 1 then
+            return 0
+        end
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        redis.call('SET', KEYS[2], ARGV[4], 'EX', ARGV[3])
+        return 1
+    """
+    # KEYS: plain token key, digest token key. ARGV: refresh token, token digest, user key prefix
+    _MIGRATE_TO_DIGEST_SCRIPT: str = """
+        local user_id = redis.call('GET', KEYS[1])
+        if not user_id then
+            return 0
+        end
+        local ttl = redis.call('PTTL', KEYS[1])
+        redis.call('DEL', KEYS[1])
+        if ttl <= 0 then
+            return 0
+        end
+        redis.call('SET', KEYS[2], user_id, 'PX', ttl)
+        local user_key = ARGV[3] .. user_id
+        if redis.call('GET', user_key) == ARGV[1] then
+            redis.call('SET', user_key, ARGV[2], 'KEEPTTL')
+        end
+        return 1
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            db: int,
+            password: str = '',
+            token_expiration: int = 0,
+            storage_mode: str = TokenStorageModes.PLAIN.value,
+            max_connections: t.Optional[int] = None,
+            socket_timeout: t.Optional[float] = None,
+            socket_connect_timeout: t.Optional[float] = None,
+            health_check_interval: int = 0,
+    ) -> None:
+        """Refresh token storage backed by Redis.
+
+        Notes:
+            Every session is stored as two keys with the same TTL:
+            "refreshToken:<token>" -> user id and "userRefreshToken:<user id>" -> token.
+            In the "digest" storage mode a token is replaced by its BLAKE2b digest in both keys,
+            so a session takes less memory and a Redis dump does not contain usable tokens.
+            Sessions stored before the "digest" mode was turned on are still found, rotated and revoked,
+            "flask storage migrate-digest" converts them.
+
+            Connections are taken from a connection pool shared by all calls of a worker process
+            (see context_managers.ProcessConnectionPool).
+
+        Args:
+            host (str): Redis host
+            port (int): Redis port
+            db (int): Redis DB number
+            password (str): Redis password
+            token_expiration (int): Session TTL in seconds. Redis removes a session once it expires
+            storage_mode (str): "plain" or "digest"
+            max_connections (int, optional): Max number of connections in the pool
+            socket_timeout (float, optional): Socket timeout in seconds
+            socket_connect_timeout (float, optional): Socket connect timeout in seconds
+            health_check_interval (int): Idle time in seconds after which a connection is checked before use
+        """
         self._host: str = host
         self._port: int = port
         self._password: str = password
         self._db: int = db
+        self._token_expiration: int = token_expiration
+        self._storage_mode: TokenStorageModes = TokenStorageModes(storage_mode)
         #
-        self._context_manager_context = {
-            'host': self._host,
-            'port': self._port,
-            'password': self._password,
-            'db': self._db,
-        }
+        self._connection_pool: ProcessConnectionPool = ProcessConnectionPool(
+            host=self._host,
+            port=self._port,
+            password=self._password,
+            db=self._db,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            health_check_interval=health_check_interval,
+            decode_responses=True,
+        )
+        self._issue_script: Script = create_script(self._ISSUE_SCRIPT)
+        self._rotate_script: Script = create_script(self._ROTATE_SCRIPT)
+        self._revoke_script: Script = create_script(self._REVOKE_SCRIPT)
+        self._migrate_legacy_script: Script = create_script(self._MIGRATE_LEGACY_SCRIPT)
+        self._migrate_to_digest_script: Script = create_script(self._MIGRATE_TO_DIGEST_SCRIPT)
+
+    @property
+    def connection_pool(self) -> ConnectionPool:
+        """ConnectionPool: a connection pool of the current process"""
+        return self._connection_pool.get()
+
+    def reset_connection_pool(self) -> None:
+        """Drops the current connection pool, so a new one is created on the next call
 
+        Returns:
+            None
+        """
+        self._connection_pool.reset()
+
+    def warm_up_connection_pool(self, connections: int) -> None:
+        """Opens connections of the current process pool in advance
+
+        Args:
+            connections (int): Number of connections
+
+        Returns:
+            None
+        """
+        self._connection_pool.warm_up(connections)
+
+    def get_pool_stats(self) -> t.Dict[str, int]:
+        """Gets connection pool usage stats of the current process
+
+        Returns:
+            dict: "created", "in_use", "idle" and "max" connection counters
+        """
+        return self._connection_pool.get_stats()
+
+    @timed('redis', 'get_user_id_by_refresh_token')
     def get_user_id_by_refresh_token(self, refresh_token: str) -> t.Optional[str]:
         """Gets a user id from Redis by refresh token
 
@@ -28,13 +245,23 @@ class RefreshTokenStorageController:
         Returns:
             str: User id
         """
-        with RedisContextManager(**self._context_manager_context) as redis_conn:
-            user_id = redis_conn.hget(self._KEY_NAME, refresh_token)
-        return user_id
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            pipe = redis_conn.pipeline(transaction=False)
+            pipe.get(self._get_token_key(refresh_token))
+            pipe.hget(self._LEGACY_KEY_NAME, refresh_token)
+            if self._storage_mode is TokenStorageModes.DIGEST:
+                # a session stored before the "digest" storage mode was turned on
+                pipe.get(self._TOKEN_KEY_PREFIX + refresh_token)
+            return next(filter(None, pipe.execute()), None)
 
+    @timed('redis', 'set_user_refresh_token')
     def set_user_refresh_token(self, user_id: str, refresh_token: str) -> None:
         """Sets a new user refresh token in Redis
 
+        Notes:
+            A previous user refresh token (if any) is found via the user key and removed
+            in the same atomic server-side call, so a user always has a single active refresh token.
+
         Args:
             user_id (str): User id
             refresh_token (str): Refresh token
@@ -42,28 +269,60 @@ class RefreshTokenStorageController:
         Returns:
             None
         """
-        with RedisContextManager(**self._context_manager_context) as redis_conn:
-            data = redis_conn.hgetall(self._KEY_NAME)
-            existing_token = self._find_key_by_value(data, user_id)
-            if existing_token:
-                redis_conn.hdel(self._KEY_NAME, existing_token)
-            redis_conn.hsetnx(self._KEY_NAME, refresh_token, user_id)
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            self._issue_script(
+                keys=[
+                    self._get_token_key(refresh_token),
+                    self._USER_KEY_PREFIX + user_id,
+                    self._LEGACY_KEY_NAME,
+                    self._LEGACY_USER_INDEX_KEY_NAME,
+                ],
+                args=[
+                    user_id,
+                    self._get_token_reference(refresh_token),
+                    self._token_expiration,
+                    self._token_key_prefix,
+                    self._TOKEN_KEY_PREFIX,
+                ],
+                client=redis_conn,
+            )
 
-    def reset_user_refresh_token(self, current_refresh_token: str, new_refresh_token: str) -> None:
+    @timed('redis', 'reset_user_refresh_token')
+    def reset_user_refresh_token(self, current_refresh_token: str, new_refresh_token: str) -> t.Optional[str]:
         """Replaces current refresh token by a new token in Redis
 
+        Notes:
+            The lookup and the replacement are done by one atomic server-side call,
+            so concurrent refreshes with the same token can not both succeed.
+            The new token gets a full TTL.
+
         Args:
             current_refresh_token (str): Current refresh token
             new_refresh_token (str): New refresh token
 
         Returns:
-            None
+            str (optional): User id if the current refresh token was found and rotated, None otherwise
         """
-        with RedisContextManager(**self._context_manager_context) as redis_conn:
-            user_id = redis_conn.hget(self._KEY_NAME, current_refresh_token)
-            redis_conn.hdel(self._KEY_NAME, current_refresh_token)
-            redis_conn.hsetnx(self._KEY_NAME, new_refresh_token, user_id)
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            return self._rotate_script(
+                keys=[
+                    self._get_token_key(current_refresh_token),
+                    self._get_token_key(new_refresh_token),
+                    self._LEGACY_KEY_NAME,
+                    self._LEGACY_USER_INDEX_KEY_NAME,
+                    # a session stored before the "digest" storage mode was turned on
+                    self._TOKEN_KEY_PREFIX + current_refresh_token,
+                ],
+                args=[
+                    current_refresh_token,
+                    self._get_token_reference(new_refresh_token),
+                    self._token_expiration,
+                    self._USER_KEY_PREFIX,
+                ],
+                client=redis_conn,
+            )
 
+    @timed('redis', 'remove_refresh_token')
     def remove_refresh_token(self, user_id: str) -> None:
         """Removes refresh token from Redis
 
@@ -73,18 +332,335 @@ class RefreshTokenStorageController:
         Returns:
             None
         """
-        with RedisContextManager(**self._context_manager_context) as redis_conn:
-            data = redis_conn.hgetall(self._KEY_NAME)
-            token_to_delete = self._find_key_by_value(data, user_id)
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            self._revoke_script(
+                keys=[self._USER_KEY_PREFIX + user_id, self._LEGACY_KEY_NAME, self._LEGACY_USER_INDEX_KEY_NAME],
+                args=[user_id, self._token_key_prefix, self._TOKEN_KEY_PREFIX],
+                client=redis_conn,
+            )
+
+    def compact_legacy_storage(self, get_token_ttl: t.Callable[[str], t.Optional[int]]) -> t.Dict[str, int]:
+        """Moves sessions from the legacy "refreshTokens" hash to TTL-bounded keys.
+
+        Notes:
+            The hash is read with HSCAN in batches and every batch is written with one pipeline,
+            so Redis is never blocked by a full HGETALL or a huge transaction.
+            Expired and invalid sessions are dropped, live ones keep their remaining lifetime.
+
+        Args:
+            get_token_ttl (callable): Returns remaining token lifetime in seconds or None if a token is invalid
+
+        Returns:
+            dict: compaction stats ("migrated" and "removed" counters)
+        """
+        stats = {'migrated': 0, 'removed': 0}
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            cursor = 0
+            while True:
+                cursor, batch = redis_conn.hscan(self._LEGACY_KEY_NAME, cursor, count=self._COMPACTION_BATCH_SIZE)
+                pipe = redis_conn.pipeline(transaction=False)
+                is_live = []
+                for refresh_token, user_id in batch.items():
+                    ttl = get_token_ttl(refresh_token)
+                    is_live.append(bool(ttl and ttl > 0))
+                    if is_live[-1]:
+                        self._migrate_legacy_script(
+                            keys=[
+                                self._get_token_key(refresh_token),
+                                self._USER_KEY_PREFIX + user_id,
+                                self._LEGACY_KEY_NAME,
+                                self._LEGACY_USER_INDEX_KEY_NAME,
+                            ],
+                            args=[refresh_token, user_id, ttl, self._get_token_reference(refresh_token)],
+                            client=pipe,
+                        )
+                    else:
+                        pipe.hdel(self._LEGACY_KEY_NAME, refresh_token)
+                for live, result in zip(is_live, pipe.execute()):
+                    if live and result:
+                        stats['migrated'] += 1
+                    else:
+                        stats['removed'] += 1
+                if cursor == 0:
+                    break
+            redis_conn.unlink(self._LEGACY_USER_INDEX_KEY_NAME)
+        return stats
+
+    def migrate_to_digest_storage(self) -> t.Dict[str, int]:
+        """Replaces full refresh tokens in session keys by their digests.
+
+        Notes:
+            Session keys are read with SCAN in batches, every batch is written with one pipeline.
+            A migrated session keeps its remaining lifetime.
+
+        Returns:
+            dict: migration stats ("migrated" and "skipped" counters)
+        """
+        stats = {'migrated': 0, 'skipped': 0}
+        with RedisContextManager(self.connection_pool) as redis_conn:
+            cursor = 0
+            while True:
+                cursor, keys = redis_conn.scan(
+                    cursor,
+                    match=f'{self._TOKEN_KEY_PREFIX}*',
+                    count=self._COMPACTION_BATCH_SIZE,
+                )
+                pipe = redis_conn.pipeline(transaction=False)
+                for key in keys:
+                    refresh_token = key[len(self._TOKEN_KEY_PREFIX):]
+                    digest = self._get_token_digest(refresh_token)
+                    self._migrate_to_digest_script(
+                        keys=[key, self._DIGEST_TOKEN_KEY_PREFIX + digest],
+                        args=[refresh_token, digest, self._USER_KEY_PREFIX],
+                        client=pipe,
+                    )
+                for result in pipe.execute():
+                    stats['migrated' if result else 'skipped'] += 1
+                if cursor == 0:
+                    break
+        return stats
+
+    @property
+    def _token_key_prefix(self) -> t.Union[str, bytes]:
+        if self._storage_mode is TokenStorageModes.DIGEST:
+            return self._DIGEST_TOKEN_KEY_PREFIX
+        return self._TOKEN_KEY_PREFIX
+
+    def _get_token_key(self, refresh_token: str) -> t.Union[str, bytes]:
+        return self._token_key_prefix + self._get_token_reference(refresh_token)
+
+    def _get_token_reference(self, refresh_token: str) -> t.Union[str, bytes]:
+        if self._storage_mode is TokenStorageModes.DIGEST:
+            return self._get_token_digest(refresh_token)
+        return refresh_token
+
+    def _get_token_digest(self, refresh_token: str) -> bytes:
+        return hashlib.blake2b(refresh_token.encode(), digest_size=self._TOKEN_DIGEST_SIZE).digest()
+
+
+class InMemoryRefreshTokenStorageController(ABCTokenStorage):
+    _SWEEP_INTERVAL: float = 60.0
+
+    def __init__(self, token_expiration: int = 0) -> None:
+        """Thread-safe refresh token storage that lives in the memory of the current process.
+
+        Notes:
+            Expired sessions are never returned and are evicted by a sweep
+            that runs on writes at most once per "_SWEEP_INTERVAL" seconds.
+
+        Args:
+            token_expiration (int): Session TTL in seconds
+        """
+        self._token_expiration: int = token_expiration
+        # token -> (user id, expiration time)
+        self._tokens: t.Dict[str, t.Tuple[str, float]] = {}
+        # user id -> token
+        self._user_tokens: t.Dict[str, str] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._last_sweep_at: float = _monotonic()
+
+    def get_user_id_by_refresh_token(self, refresh_token: str) -> t.Optional[str]:
+        """Gets a user id by refresh token
+
+        Args:
+            refresh_token (str): Token
+
+        Returns:
+            str: User id
+        """
+        with self._lock:
+            return self._get_live_user_id(refresh_token, _monotonic())
+
+    def set_user_refresh_token(self, user_id: str, refresh_token: str) -> None:
+        """Sets a new user refresh token, a previous user refresh token (if any) is removed
+
+        Args:
+            user_id (str): User id
+            refresh_token (str): Refresh token
+
+        Returns:
+            None
+        """
+        now = _monotonic()
+        with self._lock:
+            self._sweep(now)
+            current_token = self._user_tokens.get(user_id)
+            if current_token:
+                self._tokens.pop(current_token, None)
+            self._store(user_id, refresh_token, now)
+
+    def reset_user_refresh_token(self, current_refresh_token: str, new_refresh_token: str) -> t.Optional[str]:
+        """Replaces current refresh token by a new token
+
+        Args:
+            current_refresh_token (str): Current refresh token
+            new_refresh_token (str): New refresh token
+
+        Returns:
+            str (optional): User id if the current refresh token was found and rotated, None otherwise
+        """
+        now = _monotonic()
+        with self._lock:
+            self._sweep(now)
+            user_id = self._get_live_user_id(current_refresh_token, now)
+            if not user_id:
+                return None
+            del self._tokens[current_refresh_token]
+            self._store(user_id, new_refresh_token, now)
+        return user_id
+
+    def remove_refresh_token(self, user_id: str) -> None:
+        """Removes refresh token
+
+        Args:
+            user_id (str): User id
+
+        Returns:
+            None
+        """
+        with self._lock:
+            token_to_delete = self._user_tokens.pop(user_id, None)
             if token_to_delete:
-                redis_conn.hdel(self._KEY_NAME, token_to_delete)
+                self._tokens.pop(token_to_delete, None)
+
+    def _get_live_user_id(self, refresh_token: str, now: float) -> t.Optional[str]:
+        session = self._tokens.get(refresh_token)
+        if not session:
+            return None
+        user_id, expires_at = session
+        return user_id if expires_at > now else None
+
+    def _store(self, user_id: str, refresh_token: str, now: float) -> None:
+        self._tokens[refresh_token] = (user_id, now + self._token_expiration)
+        self._user_tokens[user_id] = refresh_token
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep_at < self._SWEEP_INTERVAL:
+            return
+        self._last_sweep_at = now
+        expired_tokens = [token for token, (_, expires_at) in self._tokens.items() if expires_at <= now]
+        for token in expired_tokens:
+            user_id, _ = self._tokens.pop(token)
+            if self._user_tokens.get(user_id) == token:
+                del self._user_tokens[user_id]
+
+
+class ResetPasswordEmailStorageController:
+    _KEY_PREFIX: bytes = b'resetPasswordEmail:'
+    _EMAIL_DIGEST_SIZE: int = 16
+
+    def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
+        """Coalesces repeated forgot password requests of one email address in Redis.
+
+        Notes:
+            The first request of an email address claims it for "RESET_PASSWORD_EMAIL_WINDOW" seconds
+            and records its outcome, repeated requests get the outcome without a DB lookup or a new email.
+            Keys contain digests of email addresses. A zero window or Redis errors disable coalescing.
+
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._window: int = self._app_config['RESET_PASSWORD_EMAIL_WINDOW']
+        self._connection_pool: ProcessConnectionPool = ProcessConnectionPool.from_config(
+            self._app_config,
+            self._app_config['REDIS_RESET_EMAIL_TOKENS_DB'],
+        )
+
+    def claim(self, email_address: str) -> t.Optional[ResetPasswordEmailStatuses]:
+        """Claims an email address for a forgot password request
+
+        Args:
+            email_address (str): Email address
 
-    @staticmethod
-    def _find_key_by_value(data: t.Dict[str, str], value: str) -> t.Optional[str]:
-        values = list(data.values())
-        keys = list(data.keys())
+        Returns:
+            ResetPasswordEmailStatuses (optional): None if the request should be processed,
+                otherwise a status of a recent request of the email address
+        """
+        if not self._window:
+            return None
+        key = self._get_key(email_address)
         try:
-            index = values.index(value)
-        except ValueError:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                pipe = redis_conn.pipeline(transaction=False)
+                pipe.set(key, ResetPasswordEmailStatuses.PENDING.value, nx=True, ex=self._window)
+                pipe.get(key)
+                claimed, status = pipe.execute()
+        except Exception as e:
+            logger.warning('Failed to claim a forgot password request, it is not coalesced. Error: %s', e)
+            return None
+        if claimed or status is None:
             return None
-        return keys[index]
+        return ResetPasswordEmailStatuses(status)
+
+    def complete(self, email_address: str, status: ResetPasswordEmailStatuses) -> None:
+        """Records an outcome of a claimed forgot password request for the rest of the window
+
+        Args:
+            email_address (str): Email address
+            status (ResetPasswordEmailStatuses): Outcome
+
+        Returns:
+            None
+        """
+        if not self._window:
+            return
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                redis_conn.set(self._get_key(email_address), status.value, xx=True, ex=self._window)
+        except Exception as e:
+            logger.warning('Failed to record a forgot password request outcome. Error: %s', e)
+
+    def release(self, email_address: str) -> None:
+        """Releases a claimed email address, e.g. if a request failed or a user with the address was created
+
+        Args:
+            email_address (str): Email address
+
+        Returns:
+            None
+        """
+        if not self._window:
+            return
+        try:
+            with RedisContextManager(self._connection_pool.get()) as redis_conn:
+                redis_conn.delete(self._get_key(email_address))
+        except Exception as e:
+            logger.warning('Failed to release a forgot password request. Error: %s', e)
+
+    def reset_connection_pool(self) -> None:
+        """Drops the connection pool, so a new one is created on the next call
+
+        Returns:
+            None
+        """
+        self._connection_pool.reset()
+
+    def _get_key(self, email_address: str) -> bytes:
+        digest = hashlib.blake2b(email_address.strip().lower().encode(), digest_size=self._EMAIL_DIGEST_SIZE)
+        return self._KEY_PREFIX + digest.digest()
+
+
+def create_refresh_token_storage_controller(config: t.Dict[str, t.Any]) -> ABCTokenStorage:
+    """Creates a refresh token storage for the configured backend
+
+    Args:
+        config (dict): app config
+
+    Returns:
+        ABCTokenStorage: RefreshTokenStorageController or InMemoryRefreshTokenStorageController
+    """
+    if TokenStorageBackends(config['TOKEN_STORAGE_BACKEND']) is TokenStorageBackends.MEMORY:
+        return InMemoryRefreshTokenStorageController(config['JWT_REFRESH_TOKEN_EXPIRATION'])
+    return RefreshTokenStorageController(
+        config['REDIS_HOST'],
+        config['REDIS_PORT'],
+        config['REDIS_JWT_DB'],
+        config['REDIS_PWD'],
+        token_expiration=config['JWT_REFRESH_TOKEN_EXPIRATION'],
+        storage_mode=config['REFRESH_TOKEN_STORAGE_MODE'],
+        max_connections=config['REDIS_POOL_MAX_CONNECTIONS'],
+        socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+        socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+        health_check_interval=config['REDIS_HEALTH_CHECK_INTERVAL'],
+    )
@@ -1,4 +1,8 @@
+import hashlib
+import threading
+import time
 import typing as t
+from collections import OrderedDict
 
 import jwt
 from itsdangerous import TimedJSONWebSignatureSerializer as JSONSerializer
@@ -7,26 +11,84 @@ from itsdangerous.exc import BadData
 import log
 from src.abstractions.abc_token_decoder import ABCTokenDecoder
 from src.exceptions import ResetPasswordTokenDecodeError
+from .metrics import timed
 
 logger = log.APILogger(__name__)
 
 
 class JWTDecoder(ABCTokenDecoder):
+    _TOKEN_DIGEST_SIZE: int = 16
 
     def __init__(self, config: t.Dict[str, t.Any] = None) -> None:
-        self._app_config = config or None
+        """JWT decoder with an optional LRU cache of already verified tokens.
+
+        Notes:
+            The cache is enabled by a positive "JWT_DECODE_CACHE_SIZE" config value.
+            It is keyed by a token digest, and an entry is never returned after the token "exp" time.
+            Tokens without "exp" are never cached.
 
-    def decode_token(self, token: str) -> str:
+        Args:
+            config (dict): app config
+        """
+        self._app_config = config or None
+        self._cache_size: int = self._app_config.get('JWT_DECODE_CACHE_SIZE', 0)
+        # token digest -> (decoded token, expiration timestamp)
+        self._cache: t.OrderedDict[bytes, t.Tuple[t.Dict[str, t.Any], float]] = OrderedDict()
+        self._cache_lock: threading.Lock = threading.Lock()
+        self._cache_hits: int = 0
+        self._cache_misses: int = 0
+
+    @timed('jwt', 'decode')
+    def decode_token(self, token: str) -> t.Dict[str, t.Any]:
         """Decodes a JWT
 
         Args:
             token (str): JWT
 
         Returns:
-            str: decoded token
+            dict: decoded token
         """
 
         logger.info('Trying to decode a JWT token...')
+        # a token of another type is not cached, PyJWT rejects it with DecodeError
+        if not self._cache_size or not isinstance(token, str):
+            return self._decode_token(token)
+
+        cache_key = hashlib.blake2b(token.encode(), digest_size=self._TOKEN_DIGEST_SIZE).digest()
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached and cached[1] > time.time():
+                self._cache.move_to_end(cache_key)
+                self._cache_hits += 1
+                return dict(cached[0])
+            if cached:
+                del self._cache[cache_key]
+            self._cache_misses += 1
+
+        data = self._decode_token(token)
+        if 'exp' in data:
+            with self._cache_lock:
+                self._cache[cache_key] = (data, data['exp'])
+                self._cache.move_to_end(cache_key)
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return dict(data)
+
+    def cache_info(self) -> t.Dict[str, int]:
+        """Gets verified token cache stats
+
+        Returns:
+            dict: "hits", "misses", "size" and "max_size" counters
+        """
+        with self._cache_lock:
+            return {
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'size': len(self._cache),
+                'max_size': self._cache_size,
+            }
+
+    def _decode_token(self, token: str) -> t.Dict[str, t.Any]:
         return jwt.decode(token, self._app_config['SECRET_KEY'], [self._app_config['JWT_ALGORITHM']])
 
 
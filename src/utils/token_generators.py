@@ -1,5 +1,8 @@
 import datetime
+import secrets
 import typing as t
+import uuid
+from enum import Enum, unique
 
 import jwt
 from itsdangerous import TimedJSONWebSignatureSerializer as JSONSerializer
@@ -8,17 +11,47 @@ import log
 from src.abstractions.abc_token_generator import ABCTokenGenerator
 from src.exceptions import AccessTokenGeneratorError, ResetPasswordTokenGeneratorError
 from src.mixins import ExpirationTimeMixin
+from .metrics import timed
 
 logger = log.APILogger(__name__)
 
 
+@unique
+class RefreshTokenTypes(Enum):
+    # a signed JWT with its own expiration time
+    JWT = 'jwt'
+    # a random string, its expiration time is held by the token storage only
+    OPAQUE = 'opaque'
+
+
+@unique
+class AccessTokenProfiles(Enum):
+    # a token has a user id only
+    MINIMAL = 'minimal'
+    # a token also has user principal claims, so it can authenticate a user without the DB
+    FULL = 'full'
+
+
 class AccessTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
+    _FULL_PROFILE_CLAIMS: t.Tuple[str, ...] = ('usr', 'eml', 'act', 'pwe')
+
     def __init__(self, config=None) -> None:
         self._app_config = config or None
+        self._profile: AccessTokenProfiles = AccessTokenProfiles(self._app_config['JWT_ACCESS_TOKEN_PROFILE'])
+
+    @property
+    def is_self_contained(self) -> bool:
+        """bool: True if tokens carry user principal claims (the "full" profile)"""
+        return self._profile is AccessTokenProfiles.FULL
 
+    @timed('jwt', 'encode_access_token')
     def create_token(self, claims: t.Dict[str, t.Any]) -> str:
         """Creates an access JWT based on claims
 
+        Notes:
+            In the "full" profile principal claims ("usr", "eml", "act", "pwe") are copied to the token,
+            see utils.UserPrincipal.to_claims.
+
         Args:
             claims (dict): JWT claims
 
@@ -32,7 +65,10 @@ class AccessTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
             raise AccessTokenGeneratorError(
                 f'Claims must contain {e} field to generate access token'
             )
-        payload = self._create_jwt_access_payload(record_id)
+        additional_claims = None
+        if self.is_self_contained:
+            additional_claims = {name: claims[name] for name in self._FULL_PROFILE_CLAIMS if name in claims}
+        payload = self._create_jwt_access_payload(record_id, additional_claims)
         token = jwt.encode(payload, self._app_config['SECRET_KEY'])
         return token
 
@@ -51,8 +87,8 @@ class AccessTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
             'exp': self.create_exp_timestamp(issued_at, token_exp_timeout),
         }
         if additional_claims:
-            additional_claims.pop('iat')
-            additional_claims.pop('exp')
+            additional_claims.pop('iat', None)
+            additional_claims.pop('exp', None)
             payload.update(additional_claims)
         return payload
 
@@ -61,6 +97,7 @@ class RefreshTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
     def __init__(self, config=None) -> None:
         self._app_config = config or None
 
+    @timed('jwt', 'encode_refresh_token')
     def create_token(self, claims: t.Dict[str, t.Any] = None) -> str:
         """Creates a refresh JWT based on claims
 
@@ -83,6 +120,7 @@ class RefreshTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
         issuer = self._app_config['JWT_ISSUER'] or self._app_config['SERVER_NAME']
         issued_at = datetime.datetime.utcnow()
         payload = {
+            'jti': uuid.uuid4().hex,
             'iss': issuer,
             'iat': issued_at,
             'exp': self.create_exp_timestamp(issued_at, token_exp_timeout),
@@ -95,6 +133,28 @@ class RefreshTokenGenerator(ABCTokenGenerator, ExpirationTimeMixin):
         return payload
 
 
+class OpaqueRefreshTokenGenerator(ABCTokenGenerator):
+    _TOKEN_BYTES: int = 32
+
+    def __init__(self, config=None) -> None:
+        self._app_config = config or None
+
+    def create_token(self, claims: t.Dict[str, t.Any] = None) -> str:
+        """Creates an opaque refresh token
+
+        Notes:
+            The token has no claims and can only be checked against the token storage.
+
+        Args:
+            claims (dict): ignored, accepted for compatibility with the RefreshTokenGenerator
+
+        Returns:
+            str: URL-safe random token
+        """
+        logger.info('Creating a new opaque refresh token...')
+        return secrets.token_urlsafe(self._TOKEN_BYTES)
+
+
 class ResetPasswordTokenGenerator(ABCTokenGenerator):
     def __init__(self, config=None):
         self._app_config = config or None
@@ -120,3 +180,17 @@ class ResetPasswordTokenGenerator(ABCTokenGenerator):
                 f'Claims must contain {e} field to generate token'
             )
         return self._serializer.dumps({'rid': user_id}).decode('utf-8')
+
+
+def create_refresh_token_generator(config: t.Dict[str, t.Any]) -> ABCTokenGenerator:
+    """Creates a refresh token generator for the configured refresh token type
+
+    Args:
+        config (dict): app config
+
+    Returns:
+        ABCTokenGenerator: RefreshTokenGenerator or OpaqueRefreshTokenGenerator
+    """
+    if RefreshTokenTypes(config['REFRESH_TOKEN_TYPE']) is RefreshTokenTypes.OPAQUE:
+        return OpaqueRefreshTokenGenerator(config)
+    return RefreshTokenGenerator(config)
@@ -3,13 +3,16 @@ from http import HTTPStatus
 import jwt
 from flask import Blueprint
 from flask import Response as FlaskResponse
-from flask import request, jsonify, abort, make_response
-from werkzeug.security import check_password_hash
+from flask import request, abort, make_response
 
 import log
 import run
+from src.exceptions import DBError
 from src.models import User
-from src.utils import request_helpers, decorators
+from src.utils import request_helpers, decorators, rate_limiters
+from src.utils.json_provider import jsonify
+from src.utils.principal_cache import UserPrincipal
+from src.utils.token_generators import RefreshTokenTypes
 
 logger = log.APILogger(__name__)
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -20,6 +23,8 @@ INVALID_TOKEN_MSG: str = 'Invalid refresh token'
 
 
 @auth_bp.post('/login')
+@decorators.rate_limited('LOGIN_IP', rate_limiters.get_client_ip)
+@decorators.rate_limited('LOGIN_USERNAME', rate_limiters.get_auth_username_and_client_ip, failures_only=True)
 def login() -> FlaskResponse:
     """Login a user by the Basic Auth (login and password)
 
@@ -42,14 +47,22 @@ def login() -> FlaskResponse:
         )
 
     user = User.query.filter_by(username=auth.username).first()
-    if not user or not check_password_hash(user.password, auth.password):
+    if not user or not run.password_hasher.check_password_hash(user.password, auth.password):
         logger.error(f'User ({auth.username}) provided incorrect password.')
         return make_response(
             jsonify({'msg': 'Could not verify creds'}),
             HTTPStatus.UNAUTHORIZED,
             {WWW_AUTHENTICATE: f'Basic realm="{AUTH_FAILED_REALM}"'}
         )
-    access_token = run.access_token_generator.create_token({'rid': user.id})
+    if run.password_hasher.needs_rehash(user.password):
+        logger.info('Upgrading an outdated password hash of the user %s...', user.username)
+        user.upgrade_password_hash(auth.password)
+        try:
+            user.save_to_db()
+        except DBError as e:
+            logger.error(f'Failed to upgrade a password hash of the user {user.username}. Error: {e}')
+
+    access_token = run.access_token_generator.create_token(UserPrincipal.from_user(user).to_claims())
     refresh_token = run.refresh_token_generator.create_token()
     run.refresh_token_storage_controller.set_user_refresh_token(user.id, refresh_token)
 
@@ -57,7 +70,7 @@ def login() -> FlaskResponse:
         'accessToken': access_token,
         'refreshToken': refresh_token,
     }
-    logger.info(f'User {user.username} successfully logged in.')
+    logger.info('User %s successfully logged in.', user.username)
     return jsonify(response)
 
 
@@ -68,48 +81,59 @@ def refresh() -> FlaskResponse:
     Returns:
         Response: A response with new access and refresh tokens
     """
-    logger.info(f'Got a new request for a token refresh')
+    logger.info('Got a new request for a token refresh')
     parsed_request_body = request_helpers.parse_reqeust_body_or_abort(request)
     try:
         refresh_token = parsed_request_body['refreshToken']
     except KeyError as e:
         logger.error(f'Request body does not contain a mandatory field {e}')
         return abort(HTTPStatus.UNAUTHORIZED, INVALID_TOKEN_MSG)
-
-    try:
-        run.jwt_decoder.decode_token(refresh_token)
-    except jwt.InvalidTokenError as e:
-        logger.error(f'Failed to decode token: {e}')
+    if not isinstance(refresh_token, str) or not refresh_token:
+        logger.error('Refresh token is not a non-empty string')
         return abort(HTTPStatus.UNAUTHORIZED, INVALID_TOKEN_MSG)
 
-    user_id = run.refresh_token_storage_controller.get_user_id_by_refresh_token(refresh_token)
+    # an opaque token has no claims to check, its expiration time is enforced by the token storage
+    if run.auth_api.config['REFRESH_TOKEN_TYPE'] == RefreshTokenTypes.JWT.value:
+        try:
+            run.jwt_decoder.decode_token(refresh_token)
+        except jwt.InvalidTokenError as e:
+            logger.error(f'Failed to decode token: {e}')
+            return abort(HTTPStatus.UNAUTHORIZED, INVALID_TOKEN_MSG)
+
+    new_refresh_token = run.refresh_token_generator.create_token()
+    user_id = run.refresh_token_storage_controller.reset_user_refresh_token(refresh_token, new_refresh_token)
     if not user_id:
         logger.error(f'User was not found by a token.')
         return abort(HTTPStatus.UNAUTHORIZED, INVALID_TOKEN_MSG)
 
-    access_token = run.access_token_generator.create_token({'rid': user_id})
-    new_refresh_token = run.refresh_token_generator.create_token()
-    run.refresh_token_storage_controller.reset_user_refresh_token(refresh_token, new_refresh_token)
+    claims = {'rid': user_id}
+    if run.access_token_generator.is_self_contained:
+        principal = run.user_principal_cache.get_or_load(user_id, lambda: User.get_by_id(user_id))
+        if not principal:
+            logger.error(f'User with id: {user_id} does not exist')
+            return abort(HTTPStatus.UNAUTHORIZED, INVALID_TOKEN_MSG)
+        claims = principal.to_claims()
+    access_token = run.access_token_generator.create_token(claims)
 
     response = {
         'accessToken': access_token,
         'refreshToken': new_refresh_token,
     }
-    logger.info(f'Tokens were refreshed for user with id: {user_id}')
+    logger.info('Tokens were refreshed for user with id: %s', user_id)
     return jsonify(response)
 
 
 @auth_bp.delete('/logout')
 @decorators.required_access_token
-def logout(user: User) -> FlaskResponse:
+def logout(user: UserPrincipal) -> FlaskResponse:
     """Logout a user by removing a user's refresh token from Redis
 
     Args:
-        user (User): User object
+        user (UserPrincipal): User principal
 
     Returns:
         Response: A response with NO CONTENT (204)
     """
     run.refresh_token_storage_controller.remove_refresh_token(user.id)
-    logger.info(f'{user} was logged out.')
+    logger.info('%s was logged out.', user)
     return make_response('', HTTPStatus.NO_CONTENT)
@@ -1,76 +1,103 @@
 from http import HTTPStatus
-from typing import Tuple
+from typing import Any, Dict, Optional, Tuple
 from enum import Enum, unique
 
-from flask import jsonify, Response
+from flask import Response
 from werkzeug import exceptions as exc
 
+from src.exceptions import CapacityExceededError
+from src.utils.json_provider import JSONProvider, get_json_provider
+
 
 @unique
 class ResponseStatuses(Enum):
     FAILED = 'FAILED'
 
 
+class _ErrorBody:
+    # a string that can not appear in a serialized body
+    _DETAILS_PLACEHOLDER: str = '\x00details\x00'
+
+    def __init__(self, message: str) -> None:
+        """An error body with fixed "status" and "message" fields that are serialized once per JSON provider
+
+        Args:
+            message (str): Error message
+        """
+        self._message: str = message
+        # (provider, prefix, suffix), replaced at once, so threads never see parts of another provider
+        self._parts: Tuple[Optional[JSONProvider], bytes, bytes] = (None, b'', b'')
+
+    def response(self, details: Any) -> Response:
+        """Creates an error response, only details are serialized
+
+        Args:
+            details (any): Error details
+
+        Returns:
+            Response: Response
+        """
+        provider = get_json_provider()
+        parts = self._parts
+        if parts[0] is not provider:
+            context = {
+                'status': ResponseStatuses.FAILED.value,
+                'message': self._message,
+                'details': self._DETAILS_PLACEHOLDER,
+            }
+            body = provider.dumps(context, sort_keys=provider.sort_errors_keys)
+            prefix, _, suffix = body.partition(provider.dumps(self._DETAILS_PLACEHOLDER))
+            parts = self._parts = (provider, prefix, suffix)
+        _, prefix, suffix = parts
+        return provider.raw_response(prefix + provider.dumps(details, sort_keys=provider.sort_errors_keys) + suffix)
+
+
+_BAD_REQUEST_BODY = _ErrorBody('Invalid request body was provided.')
+_UNAUTHORIZED_BODY = _ErrorBody('Unauthorized')
+_PAGE_NOT_FOUND_BODY = _ErrorBody('Not found.')
+_METHOD_NOT_ALLOWED_BODY = _ErrorBody('The method is not allowed for the requested URL.')
+_CONFLICT_BODY = _ErrorBody('Can not process request...')
+_UNPROCESSED_ENTITY_BODY = _ErrorBody('Can not process provided data.')
+_TOO_MANY_REQUESTS_BODY = _ErrorBody('Too many requests.')
+_INTERNAL_SERVER_ERROR_BODY = _ErrorBody('Something went wrong...')
+_SERVICE_UNAVAILABLE_BODY = _ErrorBody('Service is temporarily overloaded.')
+
+
 # 4xx
 def bad_request(e: exc.BadRequest) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Invalid request body was provided.',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.BAD_REQUEST
+    return _BAD_REQUEST_BODY.response(e.description), HTTPStatus.BAD_REQUEST
 
 
 def unauthorized(e: exc.Unauthorized) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Unauthorized',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.UNAUTHORIZED
+    return _UNAUTHORIZED_BODY.response(e.description), HTTPStatus.UNAUTHORIZED
 
 
 def page_not_found(e: exc.NotFound) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Not found.',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.NOT_FOUND
+    return _PAGE_NOT_FOUND_BODY.response(e.description), HTTPStatus.NOT_FOUND
 
 
 def method_not_allowed(e: exc.MethodNotAllowed) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'The method is not allowed for the requested URL.',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.METHOD_NOT_ALLOWED
+    return _METHOD_NOT_ALLOWED_BODY.response(e.description), HTTPStatus.METHOD_NOT_ALLOWED
 
 
 def conflict(e: exc.Conflict) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Can not process request...',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.CONFLICT
+    return _CONFLICT_BODY.response(e.description), HTTPStatus.CONFLICT
 
 
 def unprocessed_entity(e: exc.UnprocessableEntity) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Can not process provided data.',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.UNPROCESSABLE_ENTITY
+    return _UNPROCESSED_ENTITY_BODY.response(e.description), HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def too_many_requests(e: exc.TooManyRequests) -> Tuple[Response, int, Dict[str, str]]:
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+    return _TOO_MANY_REQUESTS_BODY.response(e.description), HTTPStatus.TOO_MANY_REQUESTS, headers
 
 
 # 5xx
 def internal_server_error(e: exc.InternalServerError) -> Tuple[Response, int]:
-    context = {
-        'status': ResponseStatuses.FAILED.value,
-        'message': 'Something went wrong...',
-        'details': e.description,
-    }
-    return jsonify(context), HTTPStatus.INTERNAL_SERVER_ERROR
+    return _INTERNAL_SERVER_ERROR_BODY.response(e.description), HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+def service_unavailable(e: CapacityExceededError) -> Tuple[Response, int, Dict[str, str]]:
+    headers = {'Retry-After': str(e.retry_after)}
+    return _SERVICE_UNAVAILABLE_BODY.response(str(e)), HTTPStatus.SERVICE_UNAVAILABLE, headers
@@ -0,0 +1,30 @@
+import hmac
+from http import HTTPStatus
+
+from flask import Blueprint, Response, abort, request
+
+import log
+import run
+from src.utils import request_helpers
+
+logger = log.APILogger(__name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.get('/metrics')
+def metrics() -> Response:
+    """Exposes metrics of all workers in the Prometheus text format
+
+    Notes:
+        If "METRICS_TOKEN" is set, UNAUTHORIZED (401) response unless it is sent as a bearer token.
+
+    Returns:
+        Response: Metrics
+    """
+    expected_token = run.auth_api.config['METRICS_TOKEN']
+    if expected_token:
+        token = request_helpers.get_bearer_auth_token(request)
+        if not token or not hmac.compare_digest(token, expected_token):
+            logger.warning('Metrics were requested without a valid token')
+            return abort(HTTPStatus.UNAUTHORIZED, 'Invalid metrics token')
+    return Response(run.metrics.render(), content_type=run.metrics.content_type)
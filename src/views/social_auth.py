@@ -2,7 +2,7 @@ from http import HTTPStatus
 
 from flask import Blueprint
 from flask import Response as FlaskResponse
-from flask import jsonify, abort, url_for
+from flask import abort, url_for
 
 import log
 import run
@@ -10,6 +10,8 @@ from src.exceptions import DBError
 from src.models import User
 from src.utils import GoogleProfileMapper
 from src.utils import request_helpers
+from src.utils.json_provider import jsonify
+from src.utils.principal_cache import UserPrincipal
 
 logger = log.APILogger(__name__)
 
@@ -49,9 +51,9 @@ def authorize_google() -> FlaskResponse:
             logger.error(f'Failed to create a new user. Error type: {e}\nError: {e}')
             return abort(HTTPStatus.BAD_REQUEST, f'Can not create such user. Error: {e}')
         else:
-            logger.info(f'A new user {user.username} successfully created')
+            logger.info('A new user %s successfully created', user.username)
 
-    access_token = run.access_token_generator.create_token({'rid': user.id})
+    access_token = run.access_token_generator.create_token(UserPrincipal.from_user(user).to_claims())
     refresh_token = run.refresh_token_generator.create_token()
     run.refresh_token_storage_controller.set_user_refresh_token(user.id, refresh_token)
 
@@ -59,5 +61,5 @@ def authorize_google() -> FlaskResponse:
         'accessToken': access_token,
         'refreshToken': refresh_token,
     }
-    logger.info(f'User {user.username} successfully logged in.')
+    logger.info('User %s successfully logged in.', user.username)
     return jsonify(response)
@@ -1,14 +1,17 @@
 from http import HTTPStatus
 
 from flask import Blueprint, Response
-from flask import abort, jsonify, request
+from flask import abort, request
 
 import log
 import run
 from src import schemas
-from src.exceptions import ResetPasswordTokenDecodeError, DBError
+from src.exceptions import ResetPasswordTokenDecodeError, DBError, CapacityExceededError
 from src.models import User
-from src.utils import decorators, request_helpers
+from src.utils import decorators, request_helpers, rate_limiters
+from src.utils.json_provider import jsonify
+from src.utils.principal_cache import UserPrincipal
+from src.utils.storage_controllers import ResetPasswordEmailStatuses
 
 logger = log.APILogger(__name__)
 
@@ -16,6 +19,7 @@ users_bp = Blueprint('users', __name__, url_prefix='/users')
 
 
 @users_bp.post('/register')
+@decorators.rate_limited('REGISTER_IP', rate_limiters.get_client_ip)
 def register() -> Response:
     """Registers a new user via POST method"""
     logger.info('Got a new user registration request.')
@@ -33,6 +37,8 @@ def register() -> Response:
         user = User.create_user(user_info)
     except DBError as e:
         return abort(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+    except CapacityExceededError:
+        raise
     except Exception as e:
         logger.error(f'Failed to create a new user. Error type: {e}\nError: {e}')
         return abort(HTTPStatus.BAD_REQUEST, f'Can not create such user. Error: {e}')
@@ -41,6 +47,8 @@ def register() -> Response:
 
 
 @users_bp.post('/forgot-password')
+@decorators.rate_limited('FORGOT_PASSWORD_IP', rate_limiters.get_client_ip)
+@decorators.rate_limited('FORGOT_PASSWORD_EMAIL', rate_limiters.get_body_email_address)
 def forgot_password() -> Response:
     """Sends an email with refresh password instructions"""
     logger.info('Got a new forgot password request.')
@@ -50,16 +58,29 @@ def forgot_password() -> Response:
         parsed_reqeust_body
     )
     email_address = user_info['email_address']
-    user = User.get_by_email_address(email_address)
-    logger.info(f'Forgot password for {email_address}')
-    if not user:
+    logger.info('Forgot password for %s', email_address)
+
+    # repeated requests get an outcome of a recent one without a DB lookup and a new email
+    status = run.reset_password_email_storage_controller.claim(email_address)
+    if status is None:
+        try:
+            user = User.get_by_email_address(email_address)
+            if user:
+                token = run.reset_password_token_generator.create_token({'rid': user.id})
+                run.email_sender.send_password_reset_email(
+                    user.email_address,
+                    token,
+                )
+        except Exception:
+            run.reset_password_email_storage_controller.release(email_address)
+            raise
+        status = ResetPasswordEmailStatuses.SENT if user else ResetPasswordEmailStatuses.NOT_FOUND
+        run.reset_password_email_storage_controller.complete(email_address, status)
+    else:
+        logger.info('A forgot password request for %s was coalesced with a recent one.', email_address)
+
+    if status is ResetPasswordEmailStatuses.NOT_FOUND:
         abort(HTTPStatus.NOT_FOUND, f'User with email address {email_address} does not exists')
-
-    token = run.reset_password_token_generator.create_token({'rid': user.id})
-    run.email_sender.send_password_reset_email(
-        user.email_address,
-        token,
-    )
     return jsonify({'msg': 'Recovery email was sent to your email.'})
 
 
@@ -85,8 +106,8 @@ def check_reset_password_token(token: str) -> Response:
         return abort(HTTPStatus.UNAUTHORIZED, 'Invalid token.')
 
     user = User.get_by_id(user_id)
-    token = run.access_token_generator.create_token({'rid': user_id})
     if user:
+        token = run.access_token_generator.create_token(UserPrincipal.from_user(user).to_claims())
         return jsonify({
             'msg': 'Token is valid.',
             'resetPasswordToken': token,
@@ -98,11 +119,11 @@ def check_reset_password_token(token: str) -> Response:
 
 @users_bp.post('/reset-password')
 @decorators.required_access_token
-def reset_password(user: User) -> Response:
+def reset_password(principal: UserPrincipal) -> Response:
     """Resets a user password.
 
     Args:
-        user (User): User object
+        principal (UserPrincipal): User principal
 
     Returns:
         Response: Password rest status
@@ -114,6 +135,11 @@ def reset_password(user: User) -> Response:
         parsed_reqeust_body
     )
 
+    user = User.get_by_id(principal.id)
+    if not user:
+        logger.error(f'User with id: {principal.id} does not exist')
+        return abort(HTTPStatus.UNAUTHORIZED, 'Invalid user')
+
     user.password = user_info['password']
     try:
         user.save_to_db()
@@ -121,7 +147,7 @@ def reset_password(user: User) -> Response:
         logger.error(e)
         return abort(HTTPStatus.INTERNAL_SERVER_ERROR, 'Failed to update password')
 
-    logger.info(f'Password for the user {user.id} was updated')
+    logger.info('Password for the user %s was updated', user.id)
     return jsonify({'msg': 'Password updated'})
 
 
@@ -132,5 +158,5 @@ def home() -> Response:
 
 @users_bp.get('/private')
 @decorators.required_access_token
-def private(user: User) -> Response:
+def private(user: UserPrincipal) -> Response:
     return jsonify({'msg': f'private hello for user: {user}'})
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the app is not installed as a package, its modules are imported from the repository root
+ROOT_DIR: Path = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
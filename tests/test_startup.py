@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+import typing as t
+from pathlib import Path
+
+ROOT_DIR: Path = Path(__file__).resolve().parent.parent
+# import time of the application modules themselves ("self" time, without third-party packages)
+APP_IMPORT_BUDGET_MS: float = 300.0
+# import time of run.py with all dependencies, it mostly depends on Flask, SQLAlchemy and Alembic
+TOTAL_IMPORT_BUDGET_MS: float = 5000.0
+_APP_MODULES: t.Tuple[str, ...] = ('run', 'log', 'config', 'src')
+
+# fails on any connection attempt, then imports the app and prints created utils
+_IMPORT_RUN_CODE: str = """
+import json
+import socket
+
+def _connect(*args, **kwargs):
+    raise AssertionError(f'A connection was opened on import: {args}')
+
+socket.socket.connect = _connect
+socket.socket.connect_ex = _connect
+socket.create_connection = _connect
+
+import run
+
+print(json.dumps(sorted(run.get_created_utils())))
+"""
+
+
+def _import_run(cwd: Path, *args: str) -> subprocess.CompletedProcess:
+    (cwd / 'logs').mkdir(exist_ok=True)
+    return subprocess.run(
+        [sys.executable, *args, '-c', _IMPORT_RUN_CODE],
+        cwd=cwd,
+        env={**os.environ, 'PYTHONPATH': str(ROOT_DIR)},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+def _parse_import_times(stderr: str) -> t.List[t.Tuple[str, float, float]]:
+    # "import time: <self us> | <cumulative us> | <indented module name>"
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        import_times.append((module.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return import_times
+
+
+def test_import_does_not_connect_or_create_utils(tmp_path: Path) -> None:
+    result = _import_run(tmp_path)
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+
+
+def test_import_time_budget(tmp_path: Path) -> None:
+    result = _import_run(tmp_path, '-X', 'importtime')
+    assert result.returncode == 0, result.stderr
+
+    import_times = _parse_import_times(result.stderr)
+    app_modules = [
+        (module, self_ms) for module, self_ms, _ in import_times
+        if module.split('.')[0] in _APP_MODULES
+    ]
+    app_import_ms = sum(self_ms for _, self_ms in app_modules)
+    total_import_ms = next(cumulative_ms for module, _, cumulative_ms in import_times if module == 'run')
+
+    slowest = sorted(app_modules, key=lambda item: item[1], reverse=True)[:5]
+    assert app_import_ms < APP_IMPORT_BUDGET_MS, f'App modules take {app_import_ms:.1f} ms, the slowest: {slowest}'
+    assert total_import_ms < TOTAL_IMPORT_BUDGET_MS, f'"import run" takes {total_import_ms:.1f} ms'
+
+
+def test_modules_import_without_run(tmp_path: Path) -> None:
+    # models and utils get run at call time, so importing them first neither fails nor builds the app
+    for module in ('src.models', 'src.utils', 'src.utils.decorators'):
+        result = subprocess.run(
+            [sys.executable, '-c', f'import sys, {module}; assert "run" not in sys.modules'],
+            cwd=tmp_path,
+            env={**os.environ, 'PYTHONPATH': str(ROOT_DIR)},
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        assert result.returncode == 0, f'{module}: {result.stderr}'
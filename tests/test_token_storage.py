@@ -0,0 +1,143 @@
+import os
+import typing as t
+
+import pytest
+from redis import Redis
+
+from src.abstractions.abc_token_storage import ABCTokenStorage
+from src.utils import storage_controllers
+from src.utils.storage_controllers import (
+    InMemoryRefreshTokenStorageController,
+    RefreshTokenStorageController,
+    TokenStorageModes,
+)
+
+TOKEN_EXPIRATION: int = 60
+# the Redis backend runs the same tests only if a disposable DB is given, the DB is flushed
+REDIS_TEST_DB: t.Optional[str] = os.environ.get('TEST_REDIS_DB')
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake_clock = FakeClock()
+    monkeypatch.setattr(storage_controllers, '_monotonic', fake_clock)
+    return fake_clock
+
+
+def _create_redis_storage(storage_mode: TokenStorageModes) -> RefreshTokenStorageController:
+    storage = RefreshTokenStorageController(
+        host=os.environ.get('TEST_REDIS_HOST', 'localhost'),
+        port=int(os.environ.get('TEST_REDIS_PORT', 6379)),
+        db=int(REDIS_TEST_DB),
+        password=os.environ.get('TEST_REDIS_PWD', ''),
+        token_expiration=TOKEN_EXPIRATION,
+        storage_mode=storage_mode.value,
+    )
+    Redis(connection_pool=storage.connection_pool).flushdb()
+    return storage
+
+
+@pytest.fixture(params=['memory', 'redis-plain', 'redis-digest'])
+def storage(request: pytest.FixtureRequest) -> ABCTokenStorage:
+    if request.param == 'memory':
+        return InMemoryRefreshTokenStorageController(TOKEN_EXPIRATION)
+    if not REDIS_TEST_DB:
+        pytest.skip('TEST_REDIS_DB is not set')
+    return _create_redis_storage(TokenStorageModes(request.param.split('-')[1]))
+
+
+def test_issue(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+
+    assert storage.get_user_id_by_refresh_token('token-1') == 'user-1'
+    assert storage.get_user_id_by_refresh_token('unknown-token') is None
+
+
+def test_issue_replaces_a_previous_session(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+    storage.set_user_refresh_token('user-1', 'token-2')
+
+    assert storage.get_user_id_by_refresh_token('token-1') is None
+    assert storage.get_user_id_by_refresh_token('token-2') == 'user-1'
+
+
+def test_sessions_of_users_are_independent(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+    storage.set_user_refresh_token('user-2', 'token-2')
+    storage.remove_refresh_token('user-1')
+
+    assert storage.get_user_id_by_refresh_token('token-1') is None
+    assert storage.get_user_id_by_refresh_token('token-2') == 'user-2'
+
+
+def test_rotate(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+
+    assert storage.reset_user_refresh_token('token-1', 'token-2') == 'user-1'
+    assert storage.get_user_id_by_refresh_token('token-1') is None
+    assert storage.get_user_id_by_refresh_token('token-2') == 'user-1'
+
+
+def test_rotate_a_used_token(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+    storage.reset_user_refresh_token('token-1', 'token-2')
+
+    assert storage.reset_user_refresh_token('token-1', 'token-3') is None
+    assert storage.get_user_id_by_refresh_token('token-2') == 'user-1'
+    assert storage.get_user_id_by_refresh_token('token-3') is None
+
+
+def test_rotate_an_unknown_token(storage: ABCTokenStorage) -> None:
+    assert storage.reset_user_refresh_token('unknown-token', 'token-2') is None
+    assert storage.get_user_id_by_refresh_token('token-2') is None
+
+
+def test_revoke(storage: ABCTokenStorage) -> None:
+    storage.set_user_refresh_token('user-1', 'token-1')
+    storage.reset_user_refresh_token('token-1', 'token-2')
+    storage.remove_refresh_token('user-1')
+
+    assert storage.get_user_id_by_refresh_token('token-2') is None
+    assert storage.reset_user_refresh_token('token-2', 'token-3') is None
+    # a user without a session
+    storage.remove_refresh_token('user-1')
+
+
+def test_session_expires(clock: FakeClock) -> None:
+    storage = InMemoryRefreshTokenStorageController(TOKEN_EXPIRATION)
+    storage.set_user_refresh_token('user-1', 'token-1')
+
+    clock.now += TOKEN_EXPIRATION - 1
+    assert storage.get_user_id_by_refresh_token('token-1') == 'user-1'
+    clock.now += 1
+    assert storage.get_user_id_by_refresh_token('token-1') is None
+    assert storage.reset_user_refresh_token('token-1', 'token-2') is None
+
+
+def test_rotated_session_gets_a_full_ttl(clock: FakeClock) -> None:
+    storage = InMemoryRefreshTokenStorageController(TOKEN_EXPIRATION)
+    storage.set_user_refresh_token('user-1', 'token-1')
+
+    clock.now += TOKEN_EXPIRATION - 1
+    storage.reset_user_refresh_token('token-1', 'token-2')
+    clock.now += TOKEN_EXPIRATION - 1
+    assert storage.get_user_id_by_refresh_token('token-2') == 'user-1'
+
+
+def test_expired_sessions_are_swept(clock: FakeClock) -> None:
+    storage = InMemoryRefreshTokenStorageController(TOKEN_EXPIRATION)
+    storage.set_user_refresh_token('user-1', 'token-1')
+
+    clock.now += max(TOKEN_EXPIRATION, InMemoryRefreshTokenStorageController._SWEEP_INTERVAL)
+    storage.set_user_refresh_token('user-2', 'token-2')
+
+    assert 'token-1' not in storage._tokens
+    assert 'user-1' not in storage._user_tokens